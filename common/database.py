@@ -1,14 +1,33 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
 import os
 import dotenv
 
 dotenv.load_dotenv()
-engine = create_engine(
-    f"{os.getenv("DB_TYPE")}://{os.getenv("DB_USERNAME")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_PATH")}/{os.getenv("DB_DATABASE_NAME")}")
+
+
+def database_url(db_type):
+    return f"{db_type}://{os.getenv("DB_USERNAME")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_PATH")}/{os.getenv("DB_DATABASE_NAME")}"
+
+
+engine = create_engine(database_url(os.getenv("DB_TYPE")))
 session_factory = sessionmaker(autocommit=False,
                                autoflush=True,
                                bind=engine)
+
+# The server talks to the database through an async driver so that queries don't block the event loop
+# DB_ASYNC_URL can be set to point somewhere else entirely, such as `sqlite+aiosqlite:///local.db` for local testing
+async_drivers = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+async_engine = create_async_engine(os.getenv("DB_ASYNC_URL") or database_url(
+    async_drivers.get(os.getenv("DB_TYPE").split("+")[0], os.getenv("DB_TYPE"))))
+# Objects are handed to GraphQL resolvers after the commit, so don't expire them
+async_session_factory = async_sessionmaker(bind=async_engine,
+                                           autoflush=True,
+                                           expire_on_commit=False)
 Base = declarative_base()
 #Base.query = db_session.query_property()
 
@@ -18,4 +37,39 @@ def init_db():
     # they will be registered properly on the metadata.  Otherwise
     # you will have to import them first before calling init_db()
     import common.models as models
+    if engine.dialect.name == "postgresql":
+        # Needed by the trigram indexes on the class search columns
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+
+# (table, column) of every column added to a table after it was first deployed, their types come from the models
+added_columns = (
+    ("class_schedule", "days_mask"),
+    ("class_enrollment_stamp", "valid_through"),
+)
+# (table, index) of every index that has since been removed from the models
+dropped_indexes = (
+    # Repeated the primary key, which already starts with the class number and term
+    ("class_enrollment_stamp", "ix_class_enrollment_stamp_term_class_time"),
+)
+
+
+# create_all only creates missing tables, it never touches ones that already exist, so columns and indexes added to
+# them since are created here
+def upgrade_schema():
+    with engine.begin() as connection:
+        for table, column in added_columns:
+            if column not in {existing["name"] for existing in inspect(connection).get_columns(table)}:
+                column_type = Base.metadata.tables[table].c[column].type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+        for table, index_name in dropped_indexes:
+            if index_name in {existing["name"] for existing in inspect(connection).get_indexes(table)}:
+                # MySQL wants the table as well, Postgres and SQLite don't accept it
+                on_table = f" ON {table}" if connection.dialect.name in ("mysql", "mariadb") else ""
+                connection.execute(text(f"DROP INDEX {index_name}{on_table}"))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
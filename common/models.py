@@ -1,11 +1,33 @@
+import re
+from array import array
 from typing import List, Optional
 
 from sqlalchemy import Table, Float, DateTime, Column, Integer, \
-    String, ForeignKey, Text, ForeignKeyConstraint, UniqueConstraint, Boolean
+    String, ForeignKey, Text, ForeignKeyConstraint, UniqueConstraint, Boolean, Index, LargeBinary
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from common.database import Base
 
+# One bit per day for ClassSchedule.days_mask, so day filters become bitwise checks rather than string matching
+day_bits = {"M": 1, "Tu": 2, "W": 4, "Th": 8, "F": 16, "Sa": 32, "Su": 64}
+all_days_mask = sum(day_bits.values())
+weekdays_mask = sum(day_bits[day] for day in ("M", "Tu", "W", "Th", "F"))
+
+
+# The class search spells days like `TuTh`, the SSB pdfs like `TTH`, where a lone `T` is Tuesday and `S` Saturday
+day_spellings = {"Tu": "Tu", "Th": "Th", "Sa": "Sa", "Su": "Su", "TH": "Th", "SU": "Su", "M": "M", "T": "Tu",
+                 "W": "W", "F": "F", "S": "Sa"}
+# Longer spellings first, so `TH` isn't read as `T` followed by a stray `H`
+day_pattern = re.compile("|".join(sorted(day_spellings, key=len, reverse=True)))
+
+
+def days_to_mask(days: Optional[str]) -> int:
+    # Anything without days(such as `TBA`) gets an empty mask
+    if days is None:
+        return 0
+    return sum({day_bits[day_spellings[day]] for day in day_pattern.findall(days.replace("TBA", ""))})
+
+
 schedule_instructor_join_table = Table("schedule_instructor_join_table",
                                        Base.metadata,
                                        Column("join_id", Integer, primary_key=True),
@@ -54,6 +76,13 @@ class Class(Base):
     reserve_capacities: Mapped[Optional[List["ClassReserveCapacity"]]] = relationship("ClassReserveCapacity", cascade="all, delete", passive_deletes=True)
     last_updated_at: Mapped[DateTime] = mapped_column(DateTime)
     last_updated_from: Mapped[str] = mapped_column(String(7))
+    # Trigram indexes let Postgres answer the `ilike('%x%')` search filters without scanning the table
+    # They need the pg_trgm extension, which init_db creates, and are skipped on other backends
+    __table_args__ = tuple(
+        Index(f"ix_class_{column}_trgm", column, postgresql_using="gin",
+              postgresql_ops={column: "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+        for column in ("course_id", "title", "class_section")
+    )
 
     def to_json(self):
         attributes = {}
@@ -121,12 +150,17 @@ class ClassSchedule(Base):
     room: Mapped[Optional[str]] = mapped_column(String(16))
     instructors: Mapped[List["Instructor"]] = relationship("Instructor", secondary=schedule_instructor_join_table)
     days: Mapped[str] = mapped_column(String(10))
+    # days as a bitmask of day_bits, populated from days by the updater
+    days_mask: Mapped[Optional[int]] = mapped_column(Integer)
     # start time and end time are in minutes since midnight
     start_time: Mapped[Optional[int]] = mapped_column(Integer)
     end_time: Mapped[Optional[int]] = mapped_column(Integer)
     class_number: Mapped[int] = mapped_column(Integer)
     term: Mapped[str] = mapped_column(String(20))
-    __table_args__ = (ForeignKeyConstraint((class_number, term), (Class.class_number, Class.term)), {})
+    __table_args__ = (ForeignKeyConstraint((class_number, term), (Class.class_number, Class.term)),
+                      # Covers the per-class day and time filters so they can be answered from the index alone
+                      Index("ix_class_schedule_class_days_time", class_number, term, days_mask, start_time, end_time),
+                      {})
     class_reference: Mapped["Class"] = relationship("Class",
                                                     back_populates="schedules")
 
@@ -150,6 +184,69 @@ class CourseAttribute(Base):
     parent_course_code: Mapped[str] = mapped_column(String(10), ForeignKey("course.code"))
 
 
+course_attribute_join_table = Table("course_attribute_join_table",
+                                    Base.metadata,
+                                    Column("course_code", ForeignKey("course.code"), primary_key=True),
+                                    Column("attribute_id", ForeignKey("attribute.id"), primary_key=True), )
+
+
+# Normalized dictionary of the attributes found in CourseAttribute, split so that an entry like
+# `IDEAs in Action Gen Ed: FC-KNOWING, FC-QUANT` is two attributes that can be matched on their own
+class Attribute(Base):
+    __tablename__ = "attribute"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    label: Mapped[str] = mapped_column(Text)
+    value: Mapped[str] = mapped_column(Text, index=True)
+    __table_args__ = (UniqueConstraint("label", "value"), {})
+
+
+# The classes of a term in class number order. Bit `i` of the term's TermAttributeBitmaps stands for the `i`th of
+# them, so a bitmap only needs a bit per class in the term rather than one per possible class number.
+class TermClassIndex(Base):
+    __tablename__ = "term_class_index"
+    term: Mapped[str] = mapped_column(String(20), primary_key=True)
+    class_numbers: Mapped[bytes] = mapped_column(LargeBinary)
+    # When the term's bitmaps last changed, they change query results so this is part of the term's version
+    built_at: Mapped[DateTime] = mapped_column(DateTime)
+
+    @staticmethod
+    def encode(class_numbers) -> bytes:
+        return array("I", class_numbers).tobytes()
+
+    @staticmethod
+    def decode(class_numbers: bytes) -> List[int]:
+        return array("I", class_numbers).tolist()
+
+
+# For each term and attribute, a bitmap with bit `i` set when the `i`th class of the term's TermClassIndex has a
+# course with the attribute, so matching several attributes is an AND of bitmaps
+class TermAttributeBitmap(Base):
+    __tablename__ = "term_attribute_bitmap"
+    term: Mapped[str] = mapped_column(String(20), primary_key=True)
+    attribute_id: Mapped[int] = mapped_column(Integer, ForeignKey("attribute.id"), primary_key=True)
+    bitmap: Mapped[bytes] = mapped_column(LargeBinary)
+
+    @staticmethod
+    def encode(ordinals) -> bytes:
+        bitmap = 0
+        for ordinal in ordinals:
+            bitmap |= 1 << ordinal
+        return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+    @staticmethod
+    def decode(bitmap: bytes) -> int:
+        return int.from_bytes(bitmap, "little")
+
+    @staticmethod
+    def ordinals(bitmap: int) -> List[int]:
+        ordinals = []
+        while bitmap:
+            lowest = bitmap & -bitmap
+            ordinals.append(lowest.bit_length() - 1)
+            bitmap ^= lowest
+        return ordinals
+
+
 class Course(Base):
     __tablename__ = "course"
     code: Mapped[str] = mapped_column(String(10), primary_key=True)
@@ -157,6 +254,7 @@ class Course(Base):
     credits: Mapped[str] = mapped_column(String(20))
     description: Mapped[Optional[str]] = mapped_column(Text)
     attrs: Mapped[Optional[List["CourseAttribute"]]] = relationship("CourseAttribute")
+    attributes: Mapped[List["Attribute"]] = relationship("Attribute", secondary=course_attribute_join_table)
     last_updated_at: Mapped[DateTime] = mapped_column(DateTime)
     last_updated_from: Mapped[str] = mapped_column(String(7))
 
@@ -188,6 +286,8 @@ class TermData(Base):
 
 class ClassEnrollmentStamp(Base):
     __tablename__ = "class_enrollment_stamp"
+    # Enrollment history is read for a handful of classes at a time, which the primary key already serves since it
+    # starts with (class_number, term)
     class_number: Mapped[int] = mapped_column(Integer, primary_key=True)
     term: Mapped[str] = mapped_column(String(32), primary_key=True)
     enrollment_cap: Mapped[Optional[int]] = mapped_column(Integer)
@@ -195,7 +295,10 @@ class ClassEnrollmentStamp(Base):
     waitlist_cap: Mapped[Optional[int]] = mapped_column(Integer)
     waitlist_total: Mapped[Optional[int]] = mapped_column(Integer)
     min_enrollment: Mapped[Optional[int]] = mapped_column(Integer)
+    # Stamps are only recorded when the numbers change, `timestamp` is when these numbers were first seen and
+    # `valid_through` the last time they were still seen. Stamps from before this was tracked leave it empty.
     timestamp: Mapped[DateTime] = mapped_column(DateTime, primary_key=True)
+    valid_through: Mapped[Optional[DateTime]] = mapped_column(DateTime)
     source: Mapped[str] = mapped_column(String(7), primary_key=True)
 
 class ClassReserveCapacity(Base):
@@ -1,29 +1,43 @@
 from pathlib import Path
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+import dataclasses
 import datetime
 import filecmp
 import math
+import multiprocessing
 import os
 import re
-import urllib.request
+import sys
+import queue
+import threading
 import dotenv
 from common.discord_logger import DiscordLogger
 from os.path import exists
 import json
 import requests as requests
 from bs4 import BeautifulSoup, NavigableString
-from sqlalchemy.orm import scoped_session
-from sqlalchemy import delete, select
+from sqlalchemy.orm import scoped_session, selectinload
+from sqlalchemy import delete, or_, select
 from sqlalchemy.exc import SQLAlchemyError
 from psycopg2.errors import Error as PSQLError
 from tqdm import tqdm
-from common.database import session_factory
-from common.models import ClassReserveCapacity, Course, Class, CourseAttribute, TermDataSource, TermData, ClassSchedule, ClassEnrollmentStamp
-from utilities import search_to_schedule, get_or_create_instructor, safe_cast
+from common.database import session_factory, engine
+from common.models import ClassReserveCapacity, Course, Class, CourseAttribute, TermDataSource, TermData, ClassSchedule, ClassEnrollmentStamp, days_to_mask, \
+    Instructor, Attribute, TermAttributeBitmap, TermClassIndex, course_attribute_join_table
+from utilities import search_to_schedule, get_or_create_instructor, safe_cast, split_attribute_values, update_fields, \
+    insert_ignoring_conflicts, instructor_registry, normalize_instructor_name
+from enrollment_stamps import EnrollmentStampWriter, compact_enrollment_stamps, extend_unchanged_stamps, stamp_values
+from http_client import RateLimitedFetcher
+from http_cache import HTTPCache
 from pypdf import PdfReader
+from pdf_text import cached_page_texts, file_hash, default_workers as default_page_workers
 import pathlib
 import logging
 import time
+import typing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing, nullcontext
 
 formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
 
@@ -43,6 +57,26 @@ logger.logger.addHandler(debug_handler)
 logging.getLogger("sqlalchemy.engine").addHandler(debug_handler)
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
+# Every line the pdf parser reads along with the state it was read in
+state_logger = logging.getLogger("state_logger")
+# Set it to DEBUG for it to actually output anything at all
+state_logger.setLevel(logging.DEBUG)
+state_logger.propagate = False
+state_log_handler = TimedRotatingFileHandler((pathlib.Path(
+    __file__).parent / "logs" / "state.log").resolve(), when="midnight", backupCount=14)
+state_log_handler.suffix = "%Y%m%d"
+state_log_handler.setLevel(logging.DEBUG)
+state_log_handler.setFormatter(formatter)
+state_logger.addHandler(state_log_handler)
+# The file handlers each only take their own logger's records, so records forwarded from term workers(see
+# init_term_worker) end up in the same file they would have if written here
+state_log_handler.addFilter(lambda record: record.name == state_logger.name)
+debug_handler.addFilter(lambda record: record.name != state_logger.name)
+
+
+# Responses from every source are kept here between runs, so unchanged sources can be skipped
+http_cache = HTTPCache(str((pathlib.Path(__file__).parent / "http-cache").resolve()))
+
 
 def get_root_text(html_element):
     if isinstance(html_element, NavigableString):
@@ -76,82 +110,179 @@ subjects = (
 
 
 # gets data about courses from the catalog
-def process_course_catalog():
+# subjects whose page hasn't changed since the last successful run are skipped unless forced
+def process_course_catalog(force=False):
     db_session = scoped_session(session_factory)
     add_queue = []
     timestamp = datetime.datetime.now()
     errors = 0
-    for subject in tqdm(subjects, position=0, leave=False, desc="Subjects"):
-        try:
-            response = requests.get(
-                f"https://catalog.unc.edu/courses/{subject.lower()}/")
-
-            soup = BeautifulSoup(str(response.content).replace("\\n", "")
-                                 .replace("\\xc2\\xa0", " ").encode('utf-8').decode("unicode_escape"), "html.parser")
-
-            for course in tqdm(soup.select(".courseblock"), position=1, leave=False, desc=subject):
-                attributes = []
-                attribute_codes = ["grading_status", "making_connections", "requisites", "repeat_rules", "idea_action",
-                                   "same_as", "global_language"]
-
-                for attribute_code in attribute_codes:
-                    attribute_block = course.select_one(
-                        ".detail-" + attribute_code)
-                    if attribute_block is not None:
-                        strong_text = attribute_block.select_one("strong").text
-                        other_text = attribute_block.text.replace(
-                            strong_text, "")
-                        attributes.append(CourseAttribute(
-                            label=strong_text.strip().strip(".:"),
-                            value=other_text.strip().strip(".")))
-                add_queue.extend(attributes)
-
-                course_obj = db_session.scalar(select(Course).filter_by(
-                    code=course.select_one(".detail-code strong").text.strip(".")))
-
-                if course_obj is None:
-                    add_queue.append(Course(
-                        code=course.select_one(
-                            ".detail-code strong").text.strip("."),
-                        title=course.select_one(
-                            ".detail-title strong").text.strip("."),
-                        credits=course.select_one(
-                            ".detail-hours strong").text.strip(".").replace(" Credits", ""),
-                        description=("" if course.select_one(".courseblockextra") is None else
-                                     course.select_one(".courseblockextra").text.strip(".")),
-                        attrs=attributes,
-                        last_updated_at=timestamp,
-                        last_updated_from="catalog"
-                    ))
-                else:
-                    for attribute in course_obj.attrs:
-                        db_session.delete(attribute)
-                    course_obj.title = course.select_one(
-                        ".detail-title strong").text.strip(".")
-                    course_obj.credits = course.select_one(
-                        ".detail-hours strong").text.strip(".").replace(" Credits", "")
-                    course_obj.description = ("" if course.select_one(".courseblockextra") is None else
-                                              course.select_one(".courseblockextra").text.strip("."))
-                    course_obj.attrs = attributes
-                    course_obj.last_updated_at = timestamp
-                    course_obj.last_updated_from = "catalog"
-        except (Exception) as e:
-            logger.error(f"Failed to process subject {subject}: {e}")
-            if e is SQLAlchemyError or e is PSQLError:
-                logger.error(
-                    "Encountered a SQLAlchemy error, rolling back and skipping rest of processing")
-                db_session.rollback()
-                return
-            errors += 1
-            if errors >= 5:
-                logger.error(
-                    "Failed 5 times, something critical must be wrong")
-                return
+    # Attribute dictionary, keyed by (label, value), so each distinct attribute is only created once
+    attribute_dictionary = {(attribute.label, attribute.value): attribute
+                            for attribute in db_session.scalars(select(Attribute)).all()}
+
+    def normalize_attributes(course_attributes):
+        normalized = []
+        for course_attribute in course_attributes:
+            for value in split_attribute_values(course_attribute.label, course_attribute.value):
+                key = (course_attribute.label, value)
+                if key not in attribute_dictionary:
+                    attribute_dictionary[key] = Attribute(label=course_attribute.label, value=value)
+                if attribute_dictionary[key] not in normalized:
+                    normalized.append(attribute_dictionary[key])
+        return normalized
+
+    # Pages are fetched concurrently, but parsed and written here one at a time as they come in
+    fetcher = RateLimitedFetcher(workers=int(os.getenv("CATALOG_FETCH_WORKERS", 8)),
+                                 rate=float(os.getenv("CATALOG_RATE_LIMIT", 4)),
+                                 retries=int(os.getenv("CATALOG_FETCH_RETRIES", 3)))
+    responses = fetcher.fetch_all({subject: f"https://catalog.unc.edu/courses/{subject.lower()}/"
+                                   for subject in subjects},
+                                  fetch=lambda url: http_cache.fetch(fetcher.get, url))
+    processed_pages = []
+    unchanged_subjects = []
+    # The early returns below still have to release the fetcher's connections
+    try:
+        for subject, response in tqdm(responses, total=len(subjects), position=0, leave=False, desc="Subjects"):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                if not response.changed and not force:
+                    unchanged_subjects.append(subject)
+                    continue
+
+                soup = BeautifulSoup(str(response.content).replace("\\n", "")
+                                     .replace("\\xc2\\xa0", " ").encode('utf-8').decode("unicode_escape"), "html.parser")
+
+                for course in tqdm(soup.select(".courseblock"), position=1, leave=False, desc=subject):
+                    attributes = []
+                    attribute_codes = ["grading_status", "making_connections", "requisites", "repeat_rules", "idea_action",
+                                       "same_as", "global_language"]
+
+                    for attribute_code in attribute_codes:
+                        attribute_block = course.select_one(
+                            ".detail-" + attribute_code)
+                        if attribute_block is not None:
+                            strong_text = attribute_block.select_one("strong").text
+                            other_text = attribute_block.text.replace(
+                                strong_text, "")
+                            attributes.append(CourseAttribute(
+                                label=strong_text.strip().strip(".:"),
+                                value=other_text.strip().strip(".")))
+                    add_queue.extend(attributes)
+
+                    course_obj = db_session.scalar(select(Course).filter_by(
+                        code=course.select_one(".detail-code strong").text.strip(".")))
+
+                    if course_obj is None:
+                        add_queue.append(Course(
+                            code=course.select_one(
+                                ".detail-code strong").text.strip("."),
+                            title=course.select_one(
+                                ".detail-title strong").text.strip("."),
+                            credits=course.select_one(
+                                ".detail-hours strong").text.strip(".").replace(" Credits", ""),
+                            description=("" if course.select_one(".courseblockextra") is None else
+                                         course.select_one(".courseblockextra").text.strip(".")),
+                            attrs=attributes,
+                            attributes=normalize_attributes(attributes),
+                            last_updated_at=timestamp,
+                            last_updated_from="catalog"
+                        ))
+                    else:
+                        for attribute in course_obj.attrs:
+                            db_session.delete(attribute)
+                        course_obj.title = course.select_one(
+                            ".detail-title strong").text.strip(".")
+                        course_obj.credits = course.select_one(
+                            ".detail-hours strong").text.strip(".").replace(" Credits", "")
+                        course_obj.description = ("" if course.select_one(".courseblockextra") is None else
+                                                  course.select_one(".courseblockextra").text.strip("."))
+                        course_obj.attrs = attributes
+                        course_obj.attributes = normalize_attributes(attributes)
+                        course_obj.last_updated_at = timestamp
+                        course_obj.last_updated_from = "catalog"
+                processed_pages.append(response.key)
+            except (Exception) as e:
+                logger.error(f"Failed to process subject {subject}: {e}")
+                if e is SQLAlchemyError or e is PSQLError:
+                    logger.error(
+                        "Encountered a SQLAlchemy error, rolling back and skipping rest of processing")
+                    db_session.rollback()
+                    responses.close()
+                    return
+                errors += 1
+                if errors >= 5:
+                    logger.error(
+                        "Failed 5 times, something critical must be wrong")
+                    responses.close()
+                    return
+    finally:
+        fetcher.close()
 
     db_session.add_all(add_queue)
     db_session.commit()
     db_session.close()
 
+    # Only once everything is committed do the pages count as processed
+    for key in processed_pages:
+        http_cache.mark_processed(key)
+    logger.info(f"Skipped {len(unchanged_subjects)} unchanged catalog subjects")
+
+    build_attribute_index()
+
+
+# Rebuilds the per-term attribute bitmaps from the course attributes and every class currently saved, only writing
+# the ones that changed. Terms whose bitmaps changed get a new built_at, which moves their version on.
+# Run after anything that changes course attributes or adds classes
+def build_attribute_index():
+    db_session = scoped_session(session_factory)
+    timestamp = datetime.datetime.now()
+    term_classes = defaultdict(list)
+    for term, class_number in db_session.execute(
+            select(Class.term, Class.class_number).order_by(Class.term, Class.class_number)):
+        term_classes[term].append(class_number)
+    ordinals = {term: {class_number: ordinal for ordinal, class_number in enumerate(class_numbers)}
+                for term, class_numbers in term_classes.items()}
+
+    members = defaultdict(list)
+    for term, class_number, attribute_id in db_session.execute(
+            select(Class.term, Class.class_number, course_attribute_join_table.c.attribute_id).join(
+                course_attribute_join_table, course_attribute_join_table.c.course_code == Class.course_id)):
+        members[(term, attribute_id)].append(ordinals[term][class_number])
+
+    changed_terms = set()
+    stored_bitmaps = {(bitmap.term, bitmap.attribute_id): bitmap
+                      for bitmap in db_session.scalars(select(TermAttributeBitmap)).all()}
+    for (term, attribute_id), term_members in members.items():
+        bitmap = TermAttributeBitmap.encode(term_members)
+        stored_bitmap = stored_bitmaps.pop((term, attribute_id), None)
+        if stored_bitmap is None:
+            db_session.add(TermAttributeBitmap(term=term, attribute_id=attribute_id, bitmap=bitmap))
+            changed_terms.add(term)
+        elif update_fields(stored_bitmap, bitmap=bitmap):
+            changed_terms.add(term)
+    for stored_bitmap in stored_bitmaps.values():
+        db_session.delete(stored_bitmap)
+        changed_terms.add(stored_bitmap.term)
+
+    stored_indexes = {index.term: index for index in db_session.scalars(select(TermClassIndex)).all()}
+    for term, class_numbers in term_classes.items():
+        encoded = TermClassIndex.encode(class_numbers)
+        stored_index = stored_indexes.pop(term, None)
+        if stored_index is None:
+            db_session.add(TermClassIndex(term=term, class_numbers=encoded, built_at=timestamp))
+            changed_terms.add(term)
+        elif update_fields(stored_index, class_numbers=encoded) or term in changed_terms:
+            stored_index.built_at = timestamp
+            changed_terms.add(term)
+    for stored_index in stored_indexes.values():
+        db_session.delete(stored_index)
+        changed_terms.add(stored_index.term)
+
+    db_session.commit()
+    db_session.close()
+    logger.info(f"Rebuilt the attribute index for {len(changed_terms)} terms")
+
 
 def standardize_term_from_class_search(raw_term):
     return raw_term[5:].upper().replace(" ", "_") + "_" + raw_term[:4]
@@ -161,7 +292,8 @@ def standardize_term_from_class_search(raw_term):
 # Has meeting_dates which is not available from the pdf
 # Does not have any information about waitlist or total capacity of a class
 # Will not contain any information for any class without its own credit hours, such as physics labs or any recitations
-def process_class_search():
+# Skipped if the results are unchanged since the last successful run, unless forced
+def process_class_search(force=False):
 
     db_session = scoped_session(session_factory)
 
@@ -177,6 +309,8 @@ def process_class_search():
     logger.info("Looking for current list of available schedules")
 
     terms = []
+    # last_updated is only moved forward on these once the new results have actually been processed
+    term_data_sources = []
 
     for raw_term in json.loads(soup.select("#json_terms")[0].text):
         term = standardize_term_from_class_search(raw_term)
@@ -193,7 +327,7 @@ def process_class_search():
                            raw_term_name=raw_term, last_seen=timestamp, last_updated=timestamp))
         else:
             term_data_source.last_seen = timestamp
-            term_data_source.last_updated = timestamp
+            term_data_sources.append(term_data_source)
 
         terms.append(term)
 
@@ -201,13 +335,31 @@ def process_class_search():
     time.sleep(15)
 
     logger.info("15 seconds have passed, requesting advanced search with all terms.")
-    response = requests.get("https://reports.unc.edu/class-search/advanced_search/", params={
+    response = http_cache.fetch(requests.get, "https://reports.unc.edu/class-search/advanced_search/", params={
         "term": ", ".join(terms),
         "advanced": ", ".join(subjects)
     })
+    if not response.changed and not force:
+        logger.info("Class search results are unchanged since the last run, skipping.")
+        # The numbers were still seen now, even though nothing has to be written
+        extend_unchanged_stamps(db_session, "search", terms, timestamp)
+        db_session.commit()
+        db_session.close()
+        return
+
+    # Everything the rows are checked against is loaded up front, so the rows themselves are processed in memory
+    # and only what actually changed gets written back
+    course_codes = set(db_session.scalars(select(Course.code)).all())
+    classes = {(class_obj.class_number, class_obj.term): class_obj for class_obj in db_session.scalars(
+        select(Class).where(Class.term.in_(terms)).options(
+            selectinload(Class.schedules).selectinload(ClassSchedule.instructors))).all()}
+    instructors = instructor_registry(db_session)
 
     missing_courses = []
-    missing_classes = []
+    new_courses = []
+    new_classes = []
+    stamps = EnrollmentStampWriter(db_session, "search", terms)
+    updated_classes = 0
 
     logger.info("Got response for class search request")
     soup = BeautifulSoup(
@@ -227,12 +379,15 @@ def process_class_search():
                 static_class_data[key] = value
                 i += 2
 
+            term = standardize_term_from_class_search(class_data["term"])
+
             # check to see if the course exists, if not leave a warning
             course_id = static_class_data["subject"] + \
                 " " + static_class_data["catalog number"]
-            if db_session.query(Course.code).filter_by(code=course_id).first() is None and course_id not in missing_courses:
+            if course_id not in course_codes:
+                course_codes.add(course_id)
                 missing_courses.append(course_id)
-                db_session.add(Course(
+                new_courses.append(dict(
                     code=course_id,
                     title=class_data["course description"],
                     description=None,
@@ -245,38 +400,19 @@ def process_class_search():
 
             # weird quirk is that some classes will be listed twice in the class search if they have inconsistent schedules, for example certain language classes
             # dont record a stamp if the class has already been recorded, since theoretically the info should already be saved
-            if (db_session.query(ClassEnrollmentStamp).filter_by(
-                class_number=class_number, term=standardize_term_from_class_search(
-                    class_data["term"]),
-                    timestamp=timestamp, source="search").first() is None):
-                db_session.add(ClassEnrollmentStamp(
-                    class_number=class_number,
-                    term=standardize_term_from_class_search(
-                        class_data["term"]),
-                    enrollment_total=-1 *
-                    safe_cast(class_data["available seats"], int, 1),
-                    timestamp=timestamp,
-                    source="search"
-                ))
+            stamps.record(class_number, term, timestamp,
+                          enrollment_total=-1 * safe_cast(class_data["available seats"], int, 1))
 
-            class_obj = db_session.query(Class).filter_by(
-                class_number=class_number, term=standardize_term_from_class_search(class_data["term"])).first()
+            class_obj = classes.get((class_number, term))
             if class_obj is None:
-                if str(class_number) in missing_classes:
-                    continue
-                missing_classes.append(str(class_number))
-
-                schedule = search_to_schedule(
-                    db_session, class_data, standardize_term_from_class_search(class_data["term"]))
-                db_session.add(schedule)
+                schedule = search_to_schedule(db_session, class_data, term)
 
-                db_session.add(Class(
+                class_obj = Class(
                     course_id=course_id,
                     class_section=class_data["section number"],
                     class_number=class_number,
                     title=class_data["course description"],
-                    term=standardize_term_from_class_search(
-                        class_data["term"]),
+                    term=term,
                     units=class_data["credit hours"],
                     meeting_dates=class_data["meeting dates"],
                     instruction_type=class_data["instruction mode"],
@@ -285,14 +421,20 @@ def process_class_search():
                     safe_cast(class_data["available seats"], int, 1),
                     last_updated_at=timestamp,
                     last_updated_from="search"
-                ))
+                )
+                classes[(class_number, term)] = class_obj
+                new_classes.append(class_obj)
             else:
-                # add/update the meeting dates since this isnt available in the pdf
-                class_obj.meeting_dates = class_data["meeting dates"]
-                # add/update the instruction type since this isn't scraped from the pdf
-                class_obj.instruction_type = class_data["instruction mode"]
-                generated_schedule = search_to_schedule(
-                    db_session, class_data, standardize_term_from_class_search(class_data["term"]))
+                changed = update_fields(
+                    class_obj,
+                    # add/update the meeting dates since this isnt available in the pdf
+                    meeting_dates=class_data["meeting dates"],
+                    # add/update the instruction type since this isn't scraped from the pdf
+                    instruction_type=class_data["instruction mode"],
+                    # update enrollment total
+                    enrollment_total=(0 if class_obj.enrollment_cap is None else class_obj.enrollment_cap)
+                    - safe_cast(class_data["available seats"], int, -1))
+                generated_schedule = search_to_schedule(db_session, class_data, term)
                 found_match = False
                 # search through all of the schedules to find a matching one
                 for schedule in class_obj.schedules:
@@ -301,24 +443,24 @@ def process_class_search():
                             generated_schedule.end_time == schedule.end_time:
                         found_match = True
                         # if a match is found, check if the instructor is included
-                        if class_data["primary instructor name(s)"] not in [instructor.name for instructor in schedule.instructors]:
+                        if normalize_instructor_name(class_data["primary instructor name(s)"]) not in \
+                                [normalize_instructor_name(instructor.name) for instructor in schedule.instructors]:
                             # if instructor not included, add it
                             schedule.instructors.append(get_or_create_instructor(
                                 db_session, class_data["primary instructor name(s)"]))
+                            changed = True
                         break
 
                 # if a matching schedule not found, add the generated one
                 if not found_match:
                     class_obj.schedules.append(generated_schedule)
+                    changed = True
 
-                # update enrollment total
-                class_obj.enrollment_total = \
-                    (0 if class_obj.enrollment_cap is None else class_obj.enrollment_cap) \
-                    - safe_cast(class_data["available seats"], int, -1)
-
-                # update last updated info
-                class_obj.last_updated_at = timestamp
-                class_obj.last_updated_from = "search"
+                # update last updated info, only when something did so unchanged classes aren't written at all
+                if changed:
+                    class_obj.last_updated_at = timestamp
+                    class_obj.last_updated_from = "search"
+                    updated_classes += 1
         except Exception as e:
             logger.error(f"Failed to read class: {e}")
             if e is SQLAlchemyError or e is PSQLError:
@@ -332,14 +474,85 @@ def process_class_search():
                     "Failed 5 times, something critical must be wrong")
                 return
 
+    # Courses have to exist before the classes referencing them are flushed
+    insert_ignoring_conflicts(db_session, Course, new_courses)
+    instructors.flush()
+    db_session.add_all(new_classes)
+    stamps.flush()
+    logger.info(f"Class search added {len(new_classes)} classes and updated {updated_classes} of {len(rows)} rows")
+
+    for term_data_source in term_data_sources:
+        term_data_source.last_updated = timestamp
     db_session.commit()
     db_session.close()
+    http_cache.mark_processed(response.key)
 
     logger.info(f"Created entries for {len(missing_courses)} missing courses: " + ",".join(missing_courses))
 
 
 
 
+# How many classes PDFParser writes per commit
+pdf_chunk_size = int(os.getenv("PDF_CHUNK_SIZE", 500))
+# How many finished chunks can wait for the writer before parsing pauses
+pdf_queue_chunks = int(os.getenv("PDF_QUEUE_CHUNKS", 2))
+
+
+# A class as parsed from the pdf, in plain values so parsing never has to touch the session. Schedules are dicts of
+# their columns plus the (name, type) of their instructors.
+@dataclasses.dataclass
+class ClassRecord:
+    values: dict
+    # Set if the class's course wasn't stored yet and has to be created along with it
+    course: typing.Optional[dict] = None
+    schedules: list = dataclasses.field(default_factory=list)
+    reserve_capacities: list = dataclasses.field(default_factory=list)
+    # Whether the enrollment line was parsed, only then is an enrollment stamp recorded
+    stamped: bool = False
+    # The page and line of the split line that finished the class
+    position: typing.Optional[tuple] = None
+
+
+# Classes handed to the writer together, along with the parser's progress as of the last of them for the checkpoint
+@dataclasses.dataclass
+class ClassChunk:
+    records: typing.List[ClassRecord]
+    position: typing.Optional[tuple]
+    errors: int
+    missing_courses: typing.List[str]
+
+
+# The patterns for the lines of a class in the pdf that don't have fixed columns, compiled once rather than on every
+# line. re.VERBOSE is to allow whitespace in the regex that is exclusively for readability, as well as comments!
+instructor_pattern = re.compile(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
+                \ +(?P<type>[A-Z]+) # Look for one or more space and then get type as capitalized letter string
+                \ +([0-9]|\.)+ # Look for one or more space and then a number(we ignore this for now bc i have no clue what the purpose of it is), or a period because apparently this can be a float
+                \ +Instructor:(?P<name>.*) # Look for zero(since apparnetly a name can be empty) or more space and then `Instructor:` and then take the rest as the instructor name
+                $""", re.VERBOSE)
+instructor_continuation_pattern = re.compile(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
+                \ {140:} # Look for 140 or more spaces
+                (?P<name_ext>\S.*) # Take any string as an extension to the instructor's name, as long as the string doesn't start with a space
+                $""", re.VERBOSE)
+schedule_pattern = re.compile(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
+                   \ *Bldg:\ (?P<building>[\S]([\S]|\ [\S])*) # Look for zero or more space, then `Bldg: `, then get the building string(allowing non-whitespace and single spaces within)
+                   \ *Room:\ (?P<room>(\S.*\S)|\S) # Look for zero or more space, then `Room: `, then get room string(allowing non-zero spaces and single spaces within)
+                   \ *Days:\ (?P<days>[A-z]+) # Look for zero or more space, then `Days: `, then get days string(allowing A-z)
+                   \ *Time:\ ((?P<time>TBA)|(?P<start_time_hour>[0-9]{2}):(?P<start_time_min>[0-9]{2})\ -\ (?P<end_time_hour>[0-9]{2}):(?P<end_time_min>[0-9]{2}))
+                    # Either find TBA and put that in `time` or find the hour&min of start&end time
+                 \ *.*$""", re.VERBOSE)  # Accept an unknown number of characters tagged on since some people(AAAD 89) like to put random shit there
+# The indices change depending on how long the numbers are, as there are 15 character of spacing between entries
+# Enrollment_cap always starts at 21
+enrollment_pattern = re.compile(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
+                 \ +Class\ Enrl\ Cap:(?P<class_enrollment_cap>[0-9]+) # Look for one or more space then `Class Enrl Cap:` then find class_enrollment_cap which is one or more digits
+                 \ +Class\ Enrl\ Tot:(?P<class_enrollment_tot>[0-9]+) # Look for one or more space then `Class Enrl Tot:` then find class_enrollment_tot which is one or more digits
+                 \ +Class\ Wait\ Cap:(?P<class_waitlist_cap>[0-9]+) # Look for one or more space then `Class Wait Cap:` then find class_waitlist_cap which is one or more digits
+                 \ +Class\ Wait\ Tot:(?P<class_waitlist_tot>[0-9]+) # Look for one or more space then `Class Wait Tot:` then find class_waitlist_tot which is one or more digits
+                 \ +Class\ Min\ Enrl:(?P<class_min_enrollment>[0-9]+) # Look for one or more space then `Class Min Enrl:` then find class_min_enrollment which is one or more digits
+                 \ *.*$""", re.VERBOSE)  # Allow an unknown number of characters after a space since some people(AERO 202 Spring 2024) like to put random shit there
+# Grading basis lines that come right before a class's properties
+grading_basis_lines = frozenset(["GR1", "GR3", "GRZ", "CPF"])
+
+
 class PDFParser:
     # TODO: complete this list
     """
@@ -352,38 +565,50 @@ class PDFParser:
     """
     pdf_split_line = "____________________________________________________________________________________________________________________________________________________________"
 
+    # What the pdf says about a class, compared against the stored class when it already exists. meeting_dates isn't
+    # in the pdf and is left to the class search.
+    class_columns = ("course_id", "class_section", "title", "component", "units", "topics", "instruction_type",
+                     "enrollment_cap", "enrollment_total", "waitlist_cap", "waitlist_total", "min_enrollment",
+                     "combined_section_id", "equivalents")
+    schedule_columns = ("building", "room", "days", "days_mask", "start_time", "end_time")
+    reserve_capacity_columns = ("expire_date", "description", "enroll_cap", "enroll_total")
+
     # TODO: comprehensive documentation/comments
 
-    def __init__(self, term: str, source: str):
+    # `page_workers` is how many processes extract pages, pdf_text.default_workers if not given
+    def __init__(self, term: str, source: str, page_workers: int = None, chunk_size: int = None):
         self.term = term
         self.source = source
+        self.page_workers = page_workers
         self.reset_state()
         self.db_session = scoped_session(session_factory)
         self.missing_courses = []
+        # Filled in by load_stored before parsing
+        self.course_codes = set()
+        self.stamps = None
+        # Finished classes are handed to the writer chunk_size at a time
+        self.chunk_size = chunk_size or pdf_chunk_size
+        # Set while parsing a downloaded file, where to keep checkpoints
+        self.digest = None
+        self.checkpoint_path = None
         self.errors = 0
-        self.state_logger = logging.getLogger("state_logger")
-        # Set it to DEBUG for it to actually output anything at all
-        self.state_logger.setLevel(logging.DEBUG)
-        self.state_logger.propagate = False
-        state_log_handler = TimedRotatingFileHandler((pathlib.Path(
-            __file__).parent / "logs" / "state.log").resolve(), when="midnight", backupCount=14)
-        state_log_handler.suffix = "%Y%m%d"
-        state_log_handler.setLevel(logging.DEBUG)
-        state_log_handler.setFormatter(formatter)
-        self.state_logger.handlers.clear()
-        self.state_logger.addHandler(state_log_handler)
+        # Set by parse_pages when it gives up and by the writer thread when a chunk couldn't be written
+        self.aborted = False
+        self.write_failed = False
+        self.state_logger = state_logger
         self.state_logger.info("Starting parsing of new.")
 
     def reset_state(self):
         self.state = "waiting"
         self.class_data = None
-        self.extras = []
+        self.record = None
         self.schedule = None
         self.class_notes = []
         self.course = None
         self.instructor_name = None
         self.instructor_type = None
 
+    # Returns how it went: `unchanged`, `up_to_date`, `parsed` or `failed`
     def parse(self, force=False):
         filename = "ssb-collection/" + self.term + ".pdf"
         temp_filename = "temp/" + self.term + ".pdf"
@@ -395,13 +620,24 @@ class PDFParser:
         if exists(temp_filename):
             os.remove(temp_filename)
 
-        # Download the file
+        # Download the file, sending the validators from the last download so an unchanged file isn't sent again
         logger.info(f"Downloading {filename} from {self.source}")
-        urllib.request.urlretrieve(self.source, temp_filename)
+        download = http_cache.download(requests.get, self.source, temp_filename, filename)
+        if not download.changed and not force:
+            logger.info(f"{filename} is unchanged since it was last parsed, skipping.")
+            # The registrar still lists the same numbers, so they were still current as of now
+            extend_unchanged_stamps(self.db_session, "pdf", [self.term], datetime.datetime.now())
+            self.db_session.commit()
+            self.db_session.close()
+            if exists(temp_filename):
+                os.remove(temp_filename)
+            return "unchanged"
+        # On a 304 the last parse was either forced or didn't finish, so the kept copy is parsed again in place
+        downloaded_filename = filename if download.not_modified else temp_filename
 
-        # source_reader is exclusively for reading the run time and determine if we should continue
-        source_reader = PdfReader(temp_filename)
-        page_one = source_reader.pages[0].extract_text(
+        # The reader holds the whole file in memory, so the same one is used for the run time check and the parse
+        reader = PdfReader(downloaded_filename)
+        page_one = reader.pages[0].extract_text(
             extraction_mode="layout")
 
         self.source_datetime = datetime.datetime.strptime(
@@ -416,8 +652,9 @@ class PDFParser:
             select(TermDataSource).filter_by(term_name=self.term, source="pdf"))
         if term_data_source is None:
             logger.error(f"Could not find pdf term for `{self.term}`, but this should have been created before parsing.")
-            os.remove(temp_filename)
-            return
+            if exists(temp_filename):
+                os.remove(temp_filename)
+            return "failed"
         else:
             # Only parse if source_time is newer than last_updated, or if being forced(which should only happen in dev)
             if term_data_source.last_updated is None or self.source_datetime > term_data_source.last_updated or force:
@@ -428,310 +665,562 @@ class PDFParser:
                 if not exists("ssb-collection/"):
                     os.mkdir("ssb-collection")
 
-                # Delete existing ssb if it exists so there's room to move
-                if exists(filename):
-                    os.remove(filename)
-
-                # Move the file by renaming
-                os.rename(temp_filename, filename)
-
-                # Start new reader instance for the new location
-                reader = PdfReader(filename)
-
-                for page in tqdm(reader.pages, position=1, leave=False, desc="Pages"):
-                    for line in tqdm(page.extract_text(extraction_mode="layout").split("\n"), position=2, leave=False, desc="Lines"):
-                        if self.errors >= 5:
-                            logger.error(
-                                "Reached 5 errors, something serious must be wrong, killing parse attempt.")
-                            return
-                        try:
-                            self.state_logger.debug(f"{self.state}>|{line}")
-                            self.parse_line(line)
-                        except (Exception) as e:
-                            logger.error(f"Failed to parse line with reason {e}\nLine:`{line}`")
-                            if e is SQLAlchemyError or e is PSQLError:
-                                logger.error(
-                                    "Encountered a SQLAlchemy error, rolling back and skipping rest of processing")
-                                self.db_session.rollback()
-                                return
-                            self.errors += 1
-                            self.reset_state()
+                if downloaded_filename == temp_filename:
+                    # Delete existing ssb if it exists so there's room to move
+                    if exists(filename):
+                        os.remove(filename)
+
+                    # Move the file by renaming
+                    os.rename(temp_filename, filename)
+
+                self.load_stored()
+                # Everything this thread needs is loaded, so its transaction is ended here rather than held open for
+                # the whole parse while the writer thread commits chunk after chunk
+                self.db_session.commit()
+
+                # Pick up after the last committed chunk if a previous attempt at this exact file didn't finish
+                self.digest = download.sha256 or file_hash(filename)
+                self.checkpoint_path = "ssb-collection/" + self.term + ".checkpoint.json"
+                if force:
+                    # A forced parse starts over, so an old checkpoint is thrown away rather than left for a later
+                    # run to resume from
+                    if exists(self.checkpoint_path):
+                        os.remove(self.checkpoint_path)
+                    start_page, start_line = 0, 0
+                else:
+                    start_page, start_line = self.load_checkpoint()
+
+                # Pages are extracted in worker processes(or read back from the text sidecar if this exact file
+                # was extracted before) and come back in order for the state machine, while the classes it finishes
+                # are written by another thread
+                with closing(cached_page_texts(filename, self.page_workers, self.digest, reader, start_page)) as page_texts:
+                    if not self.write_records(self.parse_pages(
+                            tqdm(page_texts, initial=start_page, total=len(reader.pages), position=1, leave=False, desc="Pages"),
+                            start_page, start_line)):
+                        return "failed"
 
                 logger.info(f"Created entries for {len(self.missing_courses)} missing courses: " + ",".join(self.missing_courses))
                 # Update the last_updated value
-                # This is done at the very end intentionally so that it won't get updated if we run into any issues
+                # This is done at the very end intentionally so that it won't get updated if we run into any issues,
+                # the chunks committed before are only considered complete once it is
+                term_data_source = self.db_session.scalar(
+                    select(TermDataSource).filter_by(term_name=self.term, source="pdf"))
                 term_data_source.last_updated = self.source_datetime
                 self.db_session.commit()
                 self.db_session.close()
-            else:
+                http_cache.mark_processed(download.key)
+                if exists(self.checkpoint_path):
+                    os.remove(self.checkpoint_path)
+                return "parsed"
+            elif exists(temp_filename):
                 os.remove(temp_filename)
-
+            return "up_to_date"
+
+    # Stored classes are loaded a chunk at a time by write_chunk, only what's needed for every class is loaded here
+    def load_stored(self):
+        self.course_codes = set(self.db_session.scalars(select(Course.code)).all())
+        self.stamps = EnrollmentStampWriter(self.db_session, "pdf", [self.term])
+
+    # Returns the page and line to start parsing from, past everything a previous attempt at the same file committed
+    def load_checkpoint(self):
+        if not exists(self.checkpoint_path):
+            return 0, 0
+        with open(self.checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint["sha256"] != self.digest or checkpoint["source_datetime"] != self.source_datetime.isoformat():
+            return 0, 0
+        logger.info(f"Resuming {self.term} from page {checkpoint['page'] + 1}, line {checkpoint['line'] + 1}")
+        self.state = checkpoint["state"]
+        self.errors = checkpoint["errors"]
+        self.missing_courses = checkpoint["missing_courses"]
+        return checkpoint["page"], checkpoint["line"]
+
+    # Called right after a chunk is committed. Chunks always end with a split line, so parsing continues from the
+    # next line looking for the first line of a class.
+    def save_checkpoint(self, chunk):
+        if self.checkpoint_path is None or chunk.position is None:
+            return
+        page, line = chunk.position
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as checkpoint_file:
+            json.dump({
+                "sha256": self.digest,
+                "source_datetime": self.source_datetime.isoformat(),
+                "page": page,
+                "line": line + 1,
+                "state": "first_line",
+                "errors": chunk.errors,
+                "missing_courses": chunk.missing_courses,
+            }, checkpoint_file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    # Runs every line of the given pages through the state machine, yielding each class as it's finished. Sets
+    # `aborted` if parsing was abandoned.
+    # The pages start at `start_page`, and lines of that page before `start_line` are skipped.
+    def parse_pages(self, page_texts, start_page=0, start_line=0):
+        for page_index, page_text in enumerate(page_texts, start_page):
+            lines = page_text.split("\n")
+            first_line = start_line if page_index == start_page else 0
+            for line_index, line in enumerate(tqdm(lines[first_line:], position=2, leave=False, desc="Lines"), first_line):
+                if self.errors >= 5:
+                    logger.error(
+                        "Reached 5 errors, something serious must be wrong, killing parse attempt.")
+                    self.aborted = True
+                    return
+                try:
+                    self.state_logger.debug(f"{self.state}>|{line}")
+                    record = self.parse_line(line)
+                except (Exception) as e:
+                    logger.error(f"Failed to parse line with reason {e}\nLine:`{line}`")
+                    self.errors += 1
+                    self.reset_state()
+                    continue
+                if record is not None:
+                    record.position = (page_index, line_index)
+                    yield record
+
+    # Hands the records off to a writer thread chunk_size at a time, so the next chunk is parsed while the last one
+    # is merged and committed. The queue is bounded so parsing can't get far ahead of the database.
+    # Returns whether every record was parsed and written.
+    def write_records(self, records):
+        chunks = queue.Queue(maxsize=pdf_queue_chunks)
+        writer = threading.Thread(target=self.write_chunks, args=(chunks,), name=f"pdf-writer-{self.term}")
+        writer.start()
+        try:
+            pending = []
+            for record in records:
+                if self.write_failed:
+                    break
+                pending.append(record)
+                if len(pending) >= self.chunk_size:
+                    chunks.put(self.make_chunk(pending))
+                    pending = []
+            if not self.aborted and not self.write_failed:
+                chunks.put(self.make_chunk(pending))
+        finally:
+            chunks.put(None)
+            writer.join()
+        return not self.aborted and not self.write_failed
+
+    def make_chunk(self, records):
+        return ClassChunk(records=records, position=records[-1].position if len(records) > 0 else None,
+                          errors=self.errors, missing_courses=list(self.missing_courses))
+
+    # Body of the writer thread. The scoped session gives this thread a session of its own, along with its own
+    # instructor registry. After a failure the rest of the chunks are drained without writing so the parser never
+    # blocks on a full queue.
+    def write_chunks(self, chunks):
+        try:
+            while (chunk := chunks.get()) is not None:
+                if self.write_failed:
+                    continue
+                try:
+                    self.write_chunk(chunk)
+                except Exception as e:
+                    # Any exception rolls back the chunk, SQLAlchemy errors included, and is caught rather than only
+                    # SQLAlchemy's since the thread dying would leave the parser blocked on the queue
+                    logger.error(f"Failed to write classes with reason {e}, rolling back and skipping rest of processing")
+                    self.db_session.rollback()
+                    self.write_failed = True
+        finally:
+            self.db_session.remove()
+
+    # Runs one line through the state machine, returning the class it finished if it did. Each state has a handler
+    # in `line_handlers`, which returns True when the line changed the state and should also be handled by the new
+    # state's handler.
     def parse_line(self, line: str):
-        if self.state == "waiting":
-            if line.startswith(self.pdf_split_line):
-                self.state = "first_line"
-                return
         if line.startswith(self.pdf_split_line):
-            self.finish_class()
-            return
-        if self.state == "first_line":
-            # Since sometimes between pages there will be another header bit, detect this and don't throw an error,
-            # just reset to the waiting state
-            if line.strip().startswith("Report ID") or len(line.strip()) == 0:
-                self.reset_state()
-                return
-            if line[:2] != "  ":
-                logger.error(f"Looking for first_line but got `{line}`")
-                self.errors += 1
-                self.reset_state()
-                return
-            # Notes on the extra characters:
-            # So far I've found:
-            # A(standard, on almost everything)
-            # X(only on LAW classes)
-            # SSB2(Summer Session 2)
-
-            # I'm not doing regex here because I can't figure out how to include optional spaces in the character counter.
-            course_id = line[2:12].strip() + " " + line[12:23].strip()
-            if self.db_session.scalar(select(Course.code).filter_by(code=course_id)) is None and course_id not in self.missing_courses:
-                self.missing_courses.append(course_id)
-                self.course = Course(
-                    code=course_id,
-                    title=line[44:73].strip(),
-                    credits=line[102:114].strip(),
-                    last_updated_at=self.source_datetime,
-                    last_updated_from="pdf"
-                )
+            if self.state == "waiting":
+                self.state = "first_line"
+                return None
+            return self.finish_class()
+        # Stripped once here rather than in every check
+        stripped = line.strip()
+        while self.line_handlers[self.state](self, line, stripped):
+            pass
+        return None
+
+    def parse_waiting(self, line: str, stripped: str):
+        return False
+
+    def parse_first_line(self, line: str, stripped: str):
+        # Since sometimes between pages there will be another header bit, detect this and don't throw an error,
+        # just reset to the waiting state
+        if stripped.startswith("Report ID") or len(stripped) == 0:
+            self.reset_state()
+            return False
+        if line[:2] != "  ":
+            logger.error(f"Looking for first_line but got `{line}`")
+            self.errors += 1
+            self.reset_state()
+            return False
+        # Notes on the extra characters:
+        # So far I've found:
+        # A(standard, on almost everything)
+        # X(only on LAW classes)
+        # SSB2(Summer Session 2)
+
+        # I'm not doing regex here because I can't figure out how to include optional spaces in the character counter.
+        course_id = line[2:12].strip() + " " + line[12:23].strip()
+        title = line[44:73].strip()
+        units = line[102:114].strip()
+        if course_id not in self.course_codes:
+            self.course_codes.add(course_id)
+            self.missing_courses.append(course_id)
+            self.course = dict(
+                code=course_id,
+                title=title,
+                credits=units,
+                last_updated_at=self.source_datetime,
+                last_updated_from="pdf"
+            )
+
+        # The class is built up as plain values, and only turned into a model and compared against the stored
+        # one(if there is one) by the writer
+        self.record = ClassRecord(course=self.course, values=dict(
+            term=self.term,
+            course_id=course_id,
+            class_section=line[23:32].strip(),
+            class_number=int(line[32:44]),
+            title=title,
+            component=line[73:102].strip(),
+            units=units,
+            topics=line[114:143].strip(),
+            last_updated_at=self.source_datetime,
+            last_updated_from="pdf",
+        ))
+        self.state = "instruction_type"
+        return False
+
+    def parse_instruction_type(self, line: str, stripped: str):
+        if len(line[:89].strip()) > 0:
+            logger.error(f"Looking for instruction_type but got `{line}`")
+            self.errors += 1
+            self.reset_state()
+            return False
+        self.record.values["instruction_type"] = stripped
+        self.state = "notes|schedule"
+        return False
+
+    def parse_notes_or_schedule(self, line: str, stripped: str):
+        if stripped.startswith("Bldg:"):
+            self.state = "schedule"
+            return True
+        if len(stripped) > 0:
+            self.class_notes.append(stripped)
+        return False
+
+    def parse_schedule(self, line: str, stripped: str):
+        if not stripped.startswith("Bldg:"):
+            return False
+        match = schedule_pattern.match(line)
+        start_time = None
+        end_time = None
+        try:
+            start_time = (int(match.group("start_time_hour"))
+                          * 60+int(match.group("start_time_min")))
+            end_time = (int(match.group("end_time_hour"))
+                        * 60+int(match.group("end_time_min")))
+        except (TypeError, IndexError):
+            start_time = None
+            end_time = None
+        days = match.group("days").strip()
+        self.schedule = dict(building=match.group("building").strip(),
+                             room=match.group("room").strip(),
+                             days=days,
+                             days_mask=days_to_mask(days),
+                             start_time=start_time,
+                             end_time=end_time,
+                             class_number=self.record.values["class_number"],
+                             term=self.term,
+                             # (name, type) pairs, resolved to instructors by the writer
+                             instructors=[])
+        self.state = "instructor"
+        return False
+
+    # Adds the instructor being read, if there is one, to the current schedule
+    def add_instructor(self):
+        if self.instructor_type is not None:
+            self.schedule["instructors"].append((self.instructor_name, self.instructor_type))
+        self.instructor_name = None
+        self.instructor_type = None
 
-            self.class_obj = self.db_session.scalar(select(Class).filter_by(
-                class_number=int(line[32:44]), term=self.term))
+    def parse_instructor(self, line: str, stripped: str):
+        # If line starts with Class Enrl, add schedule, change state to enrollment, and process for same line
+        if stripped.startswith("Class Enrl"):
+            self.add_instructor()
+            self.record.schedules.append(self.schedule)
+            self.schedule = None
+            self.state = "enrollment"
+            return True
+        # If line starts with Bldg, add schedule, change state to schedule, and process for same line
+        if stripped.startswith("Bldg"):
+            self.add_instructor()
+            self.record.schedules.append(self.schedule)
+            self.schedule = None
+            self.state = "schedule"
+            return True
+        # Otherwise, process as an instructor entry, which always has `Instructor:` in it
+        match = instructor_pattern.match(line) if "Instructor:" in line else None
+        if match is None:
+            # If it could not be processed as a normal instructor entry, assume it is a continuation in which case just get the string at the end
+            match = instructor_continuation_pattern.match(line)
+            if match is not None:
+                self.instructor_name += match.group("name_ext")
+        else:
+            # When finding a new instructor, add the currently saved instructor data before saving more information
+            self.add_instructor()
+            self.instructor_name = match.group("name")
+            self.instructor_type = match.group("type")
+        return False
+
+    def parse_enrollment(self, line: str, stripped: str):
+        if not stripped.startswith("Class"):
+            logger.error(f"Looking for enrollment but got `{line}`")
+            self.errors += 1
+            self.reset_state()
+            return False
+
+        match = enrollment_pattern.match(line)
+        values = self.record.values
+        values["enrollment_cap"] = int(match.group("class_enrollment_cap"))
+        values["enrollment_total"] = int(match.group("class_enrollment_tot"))
+        values["waitlist_cap"] = int(match.group("class_waitlist_cap"))
+        values["waitlist_total"] = int(match.group("class_waitlist_tot"))
+        values["min_enrollment"] = int(match.group("class_min_enrollment"))
+        # The writer records an enrollment stamp for every class that got this far
+        self.record.stamped = True
+
+        self.state = "waiting_for_properties"
+        return False
+
+    def parse_waiting_for_properties(self, line: str, stripped: str):
+        if stripped in grading_basis_lines:
+            self.state = "properties"
+            return False
+        if len(stripped) > 0:
+            self.state = "properties"
+            return True
+        return False
+
+    def parse_properties(self, line: str, stripped: str):
+        if len(stripped) == 0:
+            self.state = "notes"
+            return False
+        if stripped.startswith("Combined Section ID:"):
+            self.record.values["combined_section_id"] = line[line.index(":")+1:].strip()
+        elif stripped.startswith("Class Equivalents:"):
+            self.record.values["equivalents"] = line[line.index(":")+1:].strip()
+        # Here is where we could theoretically populate the attributes(GenEds) into new course listings, but it instead should be moved into a gened credit system rather than the properties system I currently have in place.
+        # TODO: Populate GenEd credits into their own table, allowing for easy and more efficient searching
+        elif stripped.startswith("Reserve Capacity:"):
+            self.state = "reserve_capacity"
+            return True
+        return False
+
+    def parse_reserve_capacity(self, line: str, stripped: str):
+        if len(stripped) == 0:
+            self.state = "notes"
+            return False
+        if line[:35].strip() not in ("", "Reserve Capacity:"):
+            self.state = "properties"
+            return False
+
+        self.record.reserve_capacities.append(dict(
+            class_number=self.record.values["class_number"],
+            term=self.term,
+            expire_date=datetime.datetime.strptime(
+                line[34:45], "%d-%b-%Y"),
+            description=line[47:95].strip(),
+            enroll_cap=int(line[95:98]),
+            enroll_total=int(line[99:131])))
+        return False
+
+    def parse_notes(self, line: str, stripped: str):
+        if len(stripped) > 0:
+            self.class_notes.append(stripped)
+        return False
+
+    line_handlers = {
+        "waiting": parse_waiting,
+        "first_line": parse_first_line,
+        "instruction_type": parse_instruction_type,
+        "notes|schedule": parse_notes_or_schedule,
+        "schedule": parse_schedule,
+        "instructor": parse_instructor,
+        "enrollment": parse_enrollment,
+        "waiting_for_properties": parse_waiting_for_properties,
+        "properties": parse_properties,
+        "reserve_capacity": parse_reserve_capacity,
+        "notes": parse_notes,
+    }
+
+    # Returns the finished class, if there was one
+    def finish_class(self):
+        record = self.record
+        self.reset_state()
+        self.state = "first_line"
+        return record
+
+    # Merges the chunk's classes into the stored ones and commits them, then lets go of everything but the
+    # instructors(which the registry keeps handing out) so memory stays flat no matter how long the pdf is
+    def write_chunk(self, chunk):
+        instructors = instructor_registry(self.db_session)
+        # Other terms may be written by other processes at the same time, and instructors have nothing unique to
+        # insert against, so the chunk's new instructors are created and committed while holding instructor_lock,
+        # after picking up whichever ones the other processes added since
+        with instructor_lock:
+            instructors.reload()
+            for record in chunk.records:
+                for schedule in record.schedules:
+                    for name, type in schedule["instructors"]:
+                        instructors.get(name, type)
+            instructors.flush()
+            self.db_session.commit()
+        # Courses have a primary key to conflict on, another term may have just created the same one
+        insert_ignoring_conflicts(self.db_session, Course,
+                                  [record.course for record in chunk.records if record.course is not None])
+        stored_classes = {class_obj.class_number: class_obj for class_obj in self.db_session.scalars(
+            select(Class).filter_by(term=self.term).where(
+                Class.class_number.in_({record.values["class_number"] for record in chunk.records})).options(
+                selectinload(Class.schedules).selectinload(ClassSchedule.instructors),
+                selectinload(Class.reserve_capacities))).all()}
+        for record in chunk.records:
+            if record.stamped:
+                self.stamps.record(record.values["class_number"], self.term, self.source_datetime,
+                                   **{value: record.values[value] for value in stamp_values})
+            class_obj = self.build_class(record, instructors)
+            stored_class = stored_classes.get(class_obj.class_number)
+            if stored_class is None:
+                self.db_session.add(class_obj)
+                # Classes can be listed more than once, later listings are merged into this one
+                stored_classes[class_obj.class_number] = class_obj
+                logger.debug(f"Adding class {class_obj.course_id} - {class_obj.class_section} ({class_obj.class_number})")
+            elif self.merge_class(stored_class, class_obj):
+                logger.debug(f"Updating class {class_obj.course_id} - {class_obj.class_section} ({class_obj.class_number})")
+        instructors.flush()
+        self.stamps.flush()
+        self.db_session.commit()
+        for instance in list(self.db_session.identity_map.values()):
+            if not isinstance(instance, Instructor):
+                self.db_session.expunge(instance)
+        self.save_checkpoint(chunk)
+
+    # A new transient class out of a parsed record, to be added as is or merged into the stored one
+    def build_class(self, record, instructors):
+        return Class(
+            **record.values,
+            schedules=[ClassSchedule(
+                **{column: value for column, value in schedule.items() if column != "instructors"},
+                instructors=[instructors.get(name, type) for name, type in schedule["instructors"]]
+            ) for schedule in record.schedules],
+            reserve_capacities=[ClassReserveCapacity(**reserve_cap) for reserve_cap in record.reserve_capacities])
+
+    # Brings the stored class in line with the freshly parsed one, only touching the columns and rows that differ
+    # so an unchanged class isn't written at all. Returns whether anything changed.
+    def merge_class(self, stored, parsed):
+        changed = update_fields(stored, **{column: getattr(parsed, column) for column in self.class_columns})
+
+        schedule_pairs, removed_schedules, added_schedules, schedules_changed = self.merge_rows(
+            stored.schedules, parsed.schedules, self.schedule_columns)
+        changed |= schedules_changed
+        for stored_schedule, parsed_schedule in schedule_pairs:
+            if set(stored_schedule.instructors) != set(parsed_schedule.instructors):
+                stored_schedule.instructors = list(parsed_schedule.instructors)
+                changed = True
+        for schedule in removed_schedules:
+            # Reset instructors first so as to get rid of the secondary table associations
+            schedule.instructors = []
+            stored.schedules.remove(schedule)
+            self.db_session.delete(schedule)
+        stored.schedules.extend(added_schedules)
+
+        if stored.reserve_capacities is None:
+            stored.reserve_capacities = []
+        reserve_pairs, removed_reserves, added_reserves, reserves_changed = self.merge_rows(
+            stored.reserve_capacities, parsed.reserve_capacities or [], self.reserve_capacity_columns)
+        changed |= reserves_changed
+        for reserve_cap in removed_reserves:
+            stored.reserve_capacities.remove(reserve_cap)
+            self.db_session.delete(reserve_cap)
+        stored.reserve_capacities.extend(added_reserves)
+
+        if changed:
+            stored.last_updated_at = parsed.last_updated_at
+            stored.last_updated_from = parsed.last_updated_from
+        return changed
+
+    # Pairs up parsed rows with stored ones, identical rows first and then whatever is left over, which is updated in
+    # place. Returns the pairs, the stored rows to delete, the parsed rows to add and whether anything changed.
+    def merge_rows(self, stored_rows, parsed_rows, columns):
+        unmatched = defaultdict(list)
+        for row in stored_rows:
+            unmatched[tuple(getattr(row, column) for column in columns)].append(row)
+        pairs = []
+        leftover_parsed = []
+        for row in parsed_rows:
+            matches = unmatched.get(tuple(getattr(row, column) for column in columns))
+            if matches:
+                pairs.append((matches.pop(0), row))
+            else:
+                leftover_parsed.append(row)
+        leftover_stored = [row for rows in unmatched.values() for row in rows]
 
-            # Mark the self as updating if we're updating an entry rather than adding a new one
-            self.updating = self.class_obj is not None
+        for stored_row, parsed_row in zip(leftover_stored, leftover_parsed):
+            update_fields(stored_row, **{column: getattr(parsed_row, column) for column in columns})
+            pairs.append((stored_row, parsed_row))
+        changed = len(leftover_stored) > 0 or len(leftover_parsed) > 0
+        return pairs, leftover_stored[len(leftover_parsed):], leftover_parsed[len(leftover_stored):], changed
 
-            if self.class_obj is None:
-                self.class_obj = Class(
-                    term=self.term,
-                    course_id=course_id,
-                    class_section=line[23:32].strip(),
-                    class_number=int(line[32:44]),
-                    title=line[44:73].strip(),
-                    component=line[73:102].strip(),
-                    units=line[102:114].strip(),
-                    topics=line[114:143].strip(),
-                    last_updated_at=self.source_datetime,
-                    last_updated_from="pdf",
-                )
-            else:
-                self.class_obj.course_id = course_id
-                self.class_obj.class_section = line[23:32].strip()
-                self.class_obj.title = line[44:74].strip()
-                self.class_obj.component = line[74:102].strip()
-                self.class_obj.units = line[102:114].strip()
-                self.class_obj.topics = line[114:143].strip()
-                self.class_obj.last_updated_at = self.source_datetime
-                self.class_obj.last_updated_from = "pdf"
-
-                # Remove all the pre-existing schedule instances
-                for schedule in self.class_obj.schedules:
-                    # Reset instructors first so as to get rid of the secondary table associations
-                    schedule.instructors = []
-                    self.db_session.delete(schedule)
-            self.state = "instruction_type"
-            return
-        if self.state == "instruction_type":
-            if len(line[:89].strip()) > 0:
-                logger.error(f"Looking for instruction_type but got `{line}`")
-                self.errors += 1
-                self.reset_state()
-                return
-            self.class_obj.instruction_type = line.strip()
-            self.state = "notes|schedule"
-            return
-        if self.state == "notes|schedule":
-            if line.strip().startswith("Bldg:"):
-                self.state = "schedule"
-            else:
-                if len(line.strip()) > 0:
-                    self.class_notes.append(line.strip())
-                    return
-        if self.state == "instructor":
-            # If line starts with Class Enrl, add schedule, change state to enrollment, and process for same line
-            if line.strip().startswith("Class Enrl"):
-                if self.instructor_type is not None:
-                    self.schedule.instructors.append(get_or_create_instructor(
-                        self.db_session, self.instructor_name, self.instructor_type))
-                self.instructor_name = None
-                self.instructor_type = None
-                self.class_obj.schedules.append(self.schedule)
-                self.extras.append(self.schedule)
-                self.schedule = None
-                self.state = "enrollment"
-            # If line starts with Bldg, add schedule, change state to schedule, and process for same line
-            elif line.strip().startswith("Bldg"):
-                if self.instructor_type is not None:
-                    self.schedule.instructors.append(get_or_create_instructor(
-                        self.db_session, self.instructor_name, self.instructor_type))
-                self.instructor_name = None
-                self.instructor_type = None
-                self.class_obj.schedules.append(self.schedule)
-                self.extras.append(self.schedule)
-                self.schedule = None
-                self.state = "schedule"
-            # Otherwise, process as an instructor entry
-            else:
-                # Try to process as a normal instructor entry
-                match = re.match(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
-                                \ +(?P<type>[A-Z]+) # Look for one or more space and then get type as capitalized letter string
-                                \ +([0-9]|\.)+ # Look for one or more space and then a number(we ignore this for now bc i have no clue what the purpose of it is), or a period because apparently this can be a float
-                                \ +Instructor:(?P<name>.*) # Look for zero(since apparnetly a name can be empty) or more space and then `Instructor:` and then take the rest as the instructor name
-                                $""", line, re.VERBOSE)
-                if match is None:
-                    # If it could not be processed as a normal instructor entry, assume it is a continuation in which case just get the string at the end
-                    match = re.match(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
-                                \ {140:} # Look for 140 or more spaces
-                                (?P<name_ext>\S.*) # Take any string as an extension to the instructor's name, as long as the string doesn't start with a space
-                                $""", line, re.VERBOSE)
-                    if match is not None:
-                        self.instructor_name += match.group("name_ext")
-                else:
-                    # When finding a new instructor, add the currently saved instructor data before saving more information
-                    if self.instructor_type is not None:
-                        self.schedule.instructors.append(get_or_create_instructor(
-                            self.db_session, self.instructor_name, self.instructor_type))
-                    self.instructor_name = match.group("name")
-                    self.instructor_type = match.group("type")
-                    return
-        if self.state == "schedule":
-            if line.strip().startswith("Bldg:"):
-                match = re.match(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
-                                   \ *Bldg:\ (?P<building>[\S]([\S]|\ [\S])*) # Look for zero or more space, then `Bldg: `, then get the building string(allowing non-whitespace and single spaces within)
-                                   \ *Room:\ (?P<room>(\S.*\S)|\S) # Look for zero or more space, then `Room: `, then get room string(allowing non-zero spaces and single spaces within)
-                                   \ *Days:\ (?P<days>[A-z]+) # Look for zero or more space, then `Days: `, then get days string(allowing A-z)
-                                   \ *Time:\ ((?P<time>TBA)|(?P<start_time_hour>[0-9]{2}):(?P<start_time_min>[0-9]{2})\ -\ (?P<end_time_hour>[0-9]{2}):(?P<end_time_min>[0-9]{2}))
-                                    # Either find TBA and put that in `time` or find the hour&min of start&end time
-                                 \ *.*$""", line, re.VERBOSE)  # Accept an unknown number of characters tagged on since some people(AAAD 89) like to put random shit there
-                start_time = None
-                end_time = None
-                try:
-                    start_time = (int(match.group("start_time_hour"))
-                                  * 60+int(match.group("start_time_min")))
-                    end_time = (int(match.group("end_time_hour"))
-                                * 60+int(match.group("end_time_min")))
-                except (TypeError, IndexError):
-                    start_time = None
-                    end_time = None
-                self.schedule = ClassSchedule(building=match.group("building").strip(),
-                                              room=match.group("room").strip(),
-                                              days=match.group("days").strip(),
-                                              start_time=start_time,
-                                              end_time=end_time,
-                                              class_number=self.class_obj.class_number,
-                                              term=self.term)
-                self.state = "instructor"
-                return
-        if self.state == "enrollment":
-            if not line.strip().startswith("Class"):
-                logger.error(f"Looking for enrollment but got `{line}`")
-                self.errors += 1
-                self.reset_state()
-                return
 
-            # The indices change depending on how long the numbers are, as there are 15 character of spacing between entries
-            # Enrollment_cap always starts at 21
-            match = re.match(r"""^ # Read from the very start to the very end(indicated by the $ at the end) of the string
-                             \ +Class\ Enrl\ Cap:(?P<class_enrollment_cap>[0-9]+) # Look for one or more space then `Class Enrl Cap:` then find class_enrollment_cap which is one or more digits
-                             \ +Class\ Enrl\ Tot:(?P<class_enrollment_tot>[0-9]+) # Look for one or more space then `Class Enrl Tot:` then find class_enrollment_tot which is one or more digits
-                             \ +Class\ Wait\ Cap:(?P<class_waitlist_cap>[0-9]+) # Look for one or more space then `Class Wait Cap:` then find class_waitlist_cap which is one or more digits
-                             \ +Class\ Wait\ Tot:(?P<class_waitlist_tot>[0-9]+) # Look for one or more space then `Class Wait Tot:` then find class_waitlist_tot which is one or more digits
-                             \ +Class\ Min\ Enrl:(?P<class_min_enrollment>[0-9]+) # Look for one or more space then `Class Min Enrl:` then find class_min_enrollment which is one or more digits
-                             \ *.*$""", line, re.VERBOSE)  # Allow an unknown number of characters after a space since some people(AERO 202 Spring 2024) like to put random shit there
-            # re.VERBOSE is to allow whitespace in the regex that is exclusively for readability, as well as comments!
-
-            self.class_obj.enrollment_cap = int(
-                match.group("class_enrollment_cap"))
-            self.class_obj.enrollment_total = int(
-                match.group("class_enrollment_tot"))
-            self.class_obj.waitlist_cap = int(
-                match.group("class_waitlist_cap"))
-            self.class_obj.waitlist_total = int(
-                match.group("class_waitlist_tot"))
-            self.class_obj.min_enrollment = int(
-                match.group("class_min_enrollment"))
-
-            self.db_session.add(ClassEnrollmentStamp(
-                class_number=self.class_obj.class_number,
-                term=self.term,
-                enrollment_cap=self.class_obj.enrollment_cap,
-                enrollment_total=self.class_obj.enrollment_total,
-                waitlist_cap=self.class_obj.waitlist_cap,
-                waitlist_total=self.class_obj.waitlist_total,
-                min_enrollment=self.class_obj.min_enrollment,
-                timestamp=self.source_datetime,
-                source="pdf"
-            ))
-
-            self.state = "waiting_for_properties"
-            return
-        if self.state == "waiting_for_properties":
-            if line.strip() in ["GR1", "GR3", "GRZ", "CPF"]:
-                self.state = "properties"
-                return
-            elif len(line.strip()) > 0:
-                self.state = "properties"
-        if self.state == "properties":
-            if len(line.strip()) == 0:
-                self.state = "notes"
-            if line.strip().startswith("Combined Section ID:"):
-                self.class_obj.combined_section_id = line[line.index(
-                    ":")+1:].strip()
-            if line.strip().startswith("Class Equivalents:"):
-                self.class_obj.equivalents = line[line.index(":")+1:].strip()
-            # Here is where we could theoretically populate the attributes(GenEds) into new course listings, but it instead should be moved into a gened credit system rather than the properties system I currently have in place.
-            # TODO: Populate GenEd credits into their own table, allowing for easy and more efficient searching
-            if line.strip().startswith("Reserve Capacity:"):
-                self.state = "reserve_capacity"
-        if self.state == "reserve_capacity":
-            if len(line.strip()) == 0:
-                self.state = "notes"
-                return
-            if line[:35].strip() not in ["", "Reserve Capacity:"]:
-                self.state = "properties"
-                return
+@dataclasses.dataclass
+class TermResult:
+    term: str
+    # One of PDFParser.parse's results
+    status: str
+    elapsed: float
+    errors: int = 0
+    missing_courses: int = 0
+    exception: typing.Optional[str] = None
 
-            # If updating an already-existing entry, delete any pre-existing reserve capacities
-            if self.updating:
-                self.db_session.execute(delete(ClassReserveCapacity).where(
-                    ClassReserveCapacity.class_number == self.class_obj.class_number and ClassReserveCapacity.term == self.term))
-            reserve_cap = ClassReserveCapacity(
-                class_number=self.class_obj.class_number,
-                term=self.term,
-                expire_date=datetime.datetime.strptime(
-                    line[34:45], "%d-%b-%Y"),
-                description=line[47:95].strip(),
-                enroll_cap=int(line[95:98]),
-                enroll_total=int(line[99:131]))
-            self.extras.append(reserve_cap)
-            if self.class_obj.reserve_capacities is None:
-                self.class_obj.reserve_capacities = []
-            self.class_obj.reserve_capacities.append(reserve_cap)
-        if self.state == "notes":
-            if len(line.strip()) > 0:
-                self.class_notes.append(line.strip)
 
-    def finish_class(self):
-        self.db_session.add_all(self.extras)
-        if self.course is not None:
-            self.db_session.add(self.course)
-        if not self.updating:
-            self.db_session.add(self.class_obj)
-        logger.debug(f"{'Updating' if self.updating else 'Adding'} class {self.class_obj.course_id} - {self.class_obj.class_section} ({self.class_obj.class_number})")
-        self.reset_state()
-        self.state = "first_line"
+# Runs in a worker process of process_pdfs, so it only takes and returns plain values
+def parse_term(term: str, source: str, force: bool, page_workers: typing.Optional[int]) -> TermResult:
+    start = time.time()
+    parser = PDFParser(term, source, page_workers)
+    status = parser.parse(force=force)
+    return TermResult(term=term, status=status, elapsed=time.time() - start, errors=parser.errors,
+                      missing_courses=len(parser.missing_courses))
+
+
+# Held while creating instructors, replaced by one shared by every worker in term worker processes
+instructor_lock = nullcontext()
+
+
+def init_term_worker(lock, log_queue):
+    global instructor_lock
+    # Pooled connections inherited from the parent can't be shared across processes, so each worker opens its own
+    engine.dispose(close=False)
+    instructor_lock = lock
+    # The log files would be rotated by every process on its own, so workers hand their records to the main
+    # process through a handler of their own instead, which writes them with the handlers replaced here
+    worker_handler = QueueHandler(log_queue)
+    for worker_logger, file_handler in [(logger.logger, debug_handler),
+                                        (logging.getLogger("sqlalchemy.engine"), debug_handler),
+                                        (state_logger, state_log_handler)]:
+        worker_logger.removeHandler(file_handler)
+        worker_logger.addHandler(worker_handler)
+    debug_handler.close()
+    state_log_handler.close()
+
+
+# How many terms are parsed at once, 1 parses them one after another in this process
+term_workers = int(os.getenv("PDF_TERM_WORKERS", 4))
 
 
 # Read through the directory of class listings
-def process_pdfs(force=False):
+def process_pdfs(force=False, workers: int = None) -> typing.List[TermResult]:
+    workers = workers or term_workers
     logger.info("Getting directory of pdfs")
 
     response = requests.get(
@@ -739,15 +1228,14 @@ def process_pdfs(force=False):
 
     soup = BeautifulSoup(response.content, "html.parser")
 
-    for ssb_link in tqdm(soup.select(".main div > ul > li > a"), position=0, leave=False, desc="PDFs"):
+    terms = []
+    db_session = scoped_session(session_factory)
+    for ssb_link in soup.select(".main div > ul > li > a"):
         source = ssb_link["href"]
         term = ssb_link.text.upper().replace(" ", "_")
-        parser = PDFParser(term, source)
 
         logger.info(f'Found ssb with term {term}')
 
-        db_session = scoped_session(session_factory)
-
         term_data = db_session.scalar(select(TermData).filter_by(name=term))
         if term_data is None:
             logger.warning(f"Found a new term `{term}`, creating placeholder entry in term_data.")
@@ -762,9 +1250,68 @@ def process_pdfs(force=False):
         else:
             term_data_source.last_seen = datetime.datetime.now()
 
-        db_session.commit()
-        db_session.close()
-        parser.parse(force=force)
+        terms.append((term, source))
+    db_session.commit()
+    db_session.close()
+
+    results = []
+    if workers <= 1 or len(terms) <= 1:
+        for term, source in tqdm(terms, position=0, leave=False, desc="PDFs"):
+            try:
+                results.append(parse_term(term, source, force, None))
+            except Exception as e:
+                logger.error(f"Parsing {term} failed with reason {e}")
+                results.append(TermResult(term=term, status="failed", elapsed=0, exception=str(e)))
+    else:
+        # Terms get a process each, and split the page extraction processes between them. Terms parsed later
+        # don't get the cores of ones that already finished, since each term's pool is sized when it starts.
+        term_processes = min(workers, len(terms))
+        page_workers = max(1, default_page_workers // term_processes)
+        log_queue = multiprocessing.Queue()
+        log_listener = QueueListener(log_queue, debug_handler, state_log_handler, respect_handler_level=True)
+        log_listener.start()
+        try:
+            with ProcessPoolExecutor(max_workers=term_processes, initializer=init_term_worker,
+                                     initargs=(multiprocessing.Lock(), log_queue)) as executor:
+                futures = {executor.submit(parse_term, term, source, force, page_workers): term
+                           for term, source in terms}
+                for future in tqdm(as_completed(futures), total=len(futures), position=0, leave=False, desc="PDFs"):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        logger.error(f"Parsing {futures[future]} failed with reason {e}")
+                        results.append(TermResult(term=futures[future], status="failed", elapsed=0,
+                                                  exception=str(e)))
+        finally:
+            log_listener.stop()
+
+    report_term_results(results)
+    return results
+
+
+def report_term_results(results: typing.List[TermResult]):
+    for result in sorted(results, key=lambda result: result.term):
+        logger.info(f"{result.term}: {result.status} in {time_string(result.elapsed)}, {result.errors} errors, "
+                    f"{result.missing_courses} missing courses" +
+                    (f", failed with `{result.exception}`" if result.exception is not None else ""))
+    failed = [result.term for result in results if result.status == "failed"]
+    if len(failed) > 0:
+        logger.error(f"Failed to parse the pdfs for {len(failed)} of {len(results)} terms: " + ", ".join(failed))
+
+
+# Fills in days_mask for schedules saved before the column existed, and for pdf schedules(`TTH`) that were given an
+# empty mask before days_to_mask knew the pdf's spelling of the days
+def backfill_days_mask():
+    db_session = scoped_session(session_factory)
+    schedules = [schedule for schedule in db_session.scalars(select(ClassSchedule).where(
+        or_(ClassSchedule.days_mask.is_(None), ClassSchedule.days_mask == 0))).all()
+        if schedule.days_mask != days_to_mask(schedule.days)]
+    for schedule in schedules:
+        schedule.days_mask = days_to_mask(schedule.days)
+    db_session.commit()
+    db_session.close()
+    if len(schedules) > 0:
+        logger.info(f"Backfilled days_mask for {len(schedules)} schedules")
 
 
 def time_string(seconds):
@@ -778,8 +1325,18 @@ if __name__ == "__main__":
     from common.database import init_db
     init_db()
 
+    # `python data_updater.py compact_enrollment_stamps` only runs the one off stamp compaction
+    if len(sys.argv) > 1 and sys.argv[1] == "compact_enrollment_stamps":
+        compaction_session = scoped_session(session_factory)
+        removed = compact_enrollment_stamps(compaction_session)
+        compaction_session.close()
+        logger.info(f"Removed {removed} redundant enrollment stamps")
+        sys.exit(0)
+
     logger.info("Starting data update protocol")
 
+    backfill_days_mask()
+
     all_start = time.time()
     sub_start = time.time()
 
@@ -797,6 +1354,9 @@ if __name__ == "__main__":
 
     process_class_search()
 
+    # Classes were added since the catalog built the index
+    build_attribute_index()
+
     all_elapsed = time.time() - all_start
     logger.info("Finished processing class search in " +
                 time_string(time.time() - sub_start))
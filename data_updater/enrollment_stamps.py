@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+from sqlalchemy import and_, delete, func, select, tuple_, update
+
+from common.models import ClassEnrollmentStamp
+from utilities import insert_ignoring_conflicts
+
+stamp_values = ("enrollment_cap", "enrollment_total", "waitlist_cap", "waitlist_total", "min_enrollment")
+
+
+def stamp_key(stamp):
+    return stamp.class_number, stamp.term, stamp.timestamp, stamp.source
+
+
+class EnrollmentStampWriter:
+    """
+    Records enrollment stamps for one source, only adding a row when a class's numbers differ from its latest stamp.
+    Otherwise the latest stamp's `valid_through` is moved forward. Everything is written in bulk by `flush`.
+    """
+
+    def __init__(self, db_session, source: str, terms):
+        self.db_session = db_session
+        self.source = source
+        latest = select(ClassEnrollmentStamp.class_number, ClassEnrollmentStamp.term,
+                        func.max(ClassEnrollmentStamp.timestamp).label("timestamp")) \
+            .where(ClassEnrollmentStamp.term.in_(terms), ClassEnrollmentStamp.source == source) \
+            .group_by(ClassEnrollmentStamp.class_number, ClassEnrollmentStamp.term).subquery()
+        # Plain rows rather than stamp objects, so they stay usable when the session lets go of its objects
+        self.latest = {(stamp.class_number, stamp.term): stamp for stamp in db_session.execute(
+            select(ClassEnrollmentStamp.class_number, ClassEnrollmentStamp.term, ClassEnrollmentStamp.timestamp,
+                   *[getattr(ClassEnrollmentStamp, value) for value in stamp_values]).join(latest, and_(
+                ClassEnrollmentStamp.class_number == latest.c.class_number,
+                ClassEnrollmentStamp.term == latest.c.term,
+                ClassEnrollmentStamp.timestamp == latest.c.timestamp))
+            .where(ClassEnrollmentStamp.source == source)).all()}
+        self.recorded = set()
+        self.inserts = []
+        self.extensions = []
+
+    # Only the first stamp of a class in a run counts, classes listed more than once shouldn't record twice
+    def record(self, class_number: int, term: str, timestamp, **values):
+        if (class_number, term) in self.recorded:
+            return
+        self.recorded.add((class_number, term))
+        values = {value: values.get(value) for value in stamp_values}
+
+        latest = self.latest.get((class_number, term))
+        if latest is not None and all(getattr(latest, value) == values[value] for value in stamp_values):
+            self.extensions.append(dict(class_number=class_number, term=term, timestamp=latest.timestamp,
+                                        source=self.source, valid_through=timestamp))
+        else:
+            self.inserts.append(dict(class_number=class_number, term=term, timestamp=timestamp,
+                                     valid_through=timestamp, source=self.source, **values))
+
+    def flush(self):
+        insert_ignoring_conflicts(self.db_session, ClassEnrollmentStamp, self.inserts)
+        if len(self.extensions) > 0:
+            # ORM bulk update, matched on the primary key of every dict
+            self.db_session.execute(update(ClassEnrollmentStamp), self.extensions)
+        self.inserts = []
+        self.extensions = []
+
+
+# For runs whose source is unchanged since the last one, so the numbers it listed then are still current. The stamps
+# that last run saw(the ones valid through it) are extended to `timestamp`, classes it no longer listed are left be.
+def extend_unchanged_stamps(db_session, source: str, terms, timestamp):
+    for term in terms:
+        last_run = db_session.scalar(select(func.max(ClassEnrollmentStamp.valid_through)).where(
+            ClassEnrollmentStamp.term == term, ClassEnrollmentStamp.source == source))
+        if last_run is None or last_run >= timestamp:
+            continue
+        db_session.execute(update(ClassEnrollmentStamp).where(
+            ClassEnrollmentStamp.term == term, ClassEnrollmentStamp.source == source,
+            ClassEnrollmentStamp.valid_through == last_run).values(valid_through=timestamp))
+
+
+# One off clean up for stamps recorded before only changes were stored, collapses every run of identical stamps of
+# a class into its first stamp and records how long the run lasted in `valid_through`
+def compact_enrollment_stamps(db_session, chunk_size: int = 1000):
+    terms = db_session.scalars(select(ClassEnrollmentStamp.term).distinct()).all()
+    removed = 0
+    for term in terms:
+        stamps = db_session.scalars(select(ClassEnrollmentStamp).filter_by(term=term).order_by(
+            ClassEnrollmentStamp.class_number, ClassEnrollmentStamp.source, ClassEnrollmentStamp.timestamp)).all()
+        series = defaultdict(list)
+        for stamp in stamps:
+            series[(stamp.class_number, stamp.source)].append(stamp)
+
+        redundant = []
+        updates = []
+
+        def close_run(run_start, run_end):
+            if run_start.valid_through != run_end:
+                updates.append(dict(class_number=run_start.class_number, term=run_start.term,
+                                    timestamp=run_start.timestamp, source=run_start.source, valid_through=run_end))
+
+        for class_stamps in series.values():
+            run_start = None
+            run_end = None
+            for stamp in class_stamps:
+                if run_start is not None and \
+                        all(getattr(run_start, value) == getattr(stamp, value) for value in stamp_values):
+                    redundant.append(stamp_key(stamp))
+                else:
+                    if run_start is not None:
+                        close_run(run_start, run_end)
+                    run_start = stamp
+                run_end = stamp.valid_through or stamp.timestamp
+            if run_start is not None:
+                close_run(run_start, run_end)
+
+        db_session.expunge_all()
+        for i in range(0, len(updates), chunk_size):
+            db_session.execute(update(ClassEnrollmentStamp), updates[i:i + chunk_size])
+        for i in range(0, len(redundant), chunk_size):
+            db_session.execute(delete(ClassEnrollmentStamp).where(tuple_(
+                ClassEnrollmentStamp.class_number, ClassEnrollmentStamp.term, ClassEnrollmentStamp.timestamp,
+                ClassEnrollmentStamp.source).in_(redundant[i:i + chunk_size])))
+        db_session.commit()
+        removed += len(redundant)
+    return removed
@@ -0,0 +1,125 @@
+import dataclasses
+import hashlib
+import json
+import os
+import typing
+from os.path import exists
+
+
+@dataclasses.dataclass
+class CachedPage:
+    key: str
+    content: bytes
+    # False when the content is byte-identical to what the last successful run processed
+    changed: bool
+
+
+@dataclasses.dataclass
+class CachedDownload:
+    key: str
+    # True when the server answered 304, in which case nothing was written to the destination
+    not_modified: bool
+    changed: bool
+    # sha256 of the file's content, for a 304 this is the hash recorded for the kept copy
+    sha256: typing.Optional[str] = None
+
+
+class HTTPCache:
+    """
+    On-disk cache of responses from the updater's sources.
+
+    Stores each body alongside its `ETag`/`Last-Modified` so later runs can send conditional requests, and
+    remembers whether the stored body was successfully processed so stages can skip sources that haven't changed
+    since. Entries only count as processed once `mark_processed` is called, after the stage has committed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        if not exists(directory):
+            os.makedirs(directory)
+
+    def key(self, url: str, params: typing.Optional[dict] = None) -> str:
+        return hashlib.sha1(json.dumps([url, params], sort_keys=True).encode()).hexdigest()
+
+    def body_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".body")
+
+    def meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def load_meta(self, key: str) -> dict:
+        if not exists(self.meta_path(key)):
+            return {}
+        with open(self.meta_path(key)) as meta_file:
+            return json.load(meta_file)
+
+    def save_meta(self, key: str, meta: dict):
+        with open(self.meta_path(key), "w") as meta_file:
+            json.dump(meta, meta_file)
+
+    def conditional_headers(self, meta: dict) -> dict:
+        headers = {}
+        if meta.get("etag") is not None:
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified") is not None:
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def update_meta(self, key: str, meta: dict, response, identical: bool, url: str, sha256: str = None):
+        self.save_meta(key, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "processed": meta.get("processed", False) and identical,
+            "sha256": sha256,
+        })
+
+    # Fetches a page, keeping its body in the cache. `get` is called like `requests.get`.
+    def fetch(self, get, url: str, params: typing.Optional[dict] = None) -> CachedPage:
+        key = self.key(url, params)
+        meta = self.load_meta(key)
+        has_body = exists(self.body_path(key))
+        response = get(url, params=params, headers=self.conditional_headers(meta) if has_body else {})
+        # An error page must never replace the cached body, or be reported as new content
+        response.raise_for_status()
+        if response.status_code == 304:
+            with open(self.body_path(key), "rb") as body_file:
+                return CachedPage(key=key, content=body_file.read(), changed=not meta.get("processed", False))
+
+        identical = False
+        if has_body:
+            with open(self.body_path(key), "rb") as body_file:
+                identical = body_file.read() == response.content
+        with open(self.body_path(key), "wb") as body_file:
+            body_file.write(response.content)
+        self.update_meta(key, meta, response, identical, url)
+        return CachedPage(key=key, content=response.content,
+                          changed=not (identical and meta.get("processed", False)))
+
+    # Downloads a large file straight to `destination` without keeping a copy in the cache, hashing it as it's
+    # written. `reference` is where the last processed copy of the file is kept, the file only counts as unchanged
+    # if it's still there and its recorded hash matches the new download.
+    def download(self, get, url: str, destination: str, reference: str) -> CachedDownload:
+        key = self.key(url)
+        meta = self.load_meta(key)
+        headers = self.conditional_headers(meta) if exists(reference) else {}
+        digest = hashlib.sha256()
+        with get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                return CachedDownload(key=key, not_modified=True, changed=not meta.get("processed", False),
+                                      sha256=meta.get("sha256"))
+            with open(destination, "wb") as destination_file:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    digest.update(chunk)
+                    destination_file.write(chunk)
+
+        identical = exists(reference) and meta.get("sha256") == digest.hexdigest()
+        self.update_meta(key, meta, response, identical, url, digest.hexdigest())
+        return CachedDownload(key=key, not_modified=False,
+                              changed=not (identical and meta.get("processed", False)), sha256=digest.hexdigest())
+
+    def mark_processed(self, key: str):
+        meta = self.load_meta(key)
+        meta["processed"] = True
+        self.save_meta(key, meta)
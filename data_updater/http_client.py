@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket:
+    # Allows bursts of up to `capacity` requests, refilling at `rate` requests per second
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedFetcher:
+    """
+    Fetches pages over a shared pooled session from a bounded number of threads, with every attempt(retries
+    included) going through the same token bucket so the whole run stays under the rate limit.
+    """
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, workers: int = 8, rate: float = 4, retries: int = 3, backoff: float = 1, timeout: float = 30):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, capacity=workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+                if response.status_code not in self.retry_statuses or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    # Yields `(key, response)` for every `key: url` pair as the responses come in, or `(key, exception)` if the
+    # page couldn't be fetched. Requests that haven't started yet are cancelled if the caller stops early.
+    # `fetch` replaces `get` for each url, for wrapping it in something like HTTPCache.fetch.
+    def fetch_all(self, urls: dict, fetch=None):
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(fetch or self.get, url): key for key, url in urls.items()}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from os.path import exists
+
+import pypdf
+from pypdf import PdfReader
+
+# Layout extraction is CPU bound and by far the slowest part of parsing an SSB, so pages are extracted in worker
+# processes. Each worker opens the file once and then extracts whichever pages it's handed.
+default_workers = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+
+worker_reader = None
+
+
+def open_worker_reader(path: str):
+    global worker_reader
+    worker_reader = PdfReader(path)
+
+
+def extract_worker_page(index: int) -> str:
+    return worker_reader.pages[index].extract_text(extraction_mode="layout")
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+# Yields the layout text of every page in order. At most `max_in_flight` pages are submitted ahead of the one being
+# consumed, so a slow consumer doesn't end up with the whole document's text in memory. An already open `reader` of
+# the same file can be passed in to avoid reading the file again in this process.
+# `start_page` skips the pages before it entirely.
+def iter_page_texts(path: str, workers: int = None, max_in_flight: int = None, reader: PdfReader = None,
+                    start_page: int = 0):
+    workers = workers or default_workers
+    if workers <= 1:
+        reader = reader or PdfReader(path)
+        for index in range(start_page, len(reader.pages)):
+            yield reader.pages[index].extract_text(extraction_mode="layout")
+        return
+
+    max_in_flight = max_in_flight or workers * 4
+    pages = len(reader.pages) if reader is not None else page_count(path)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=open_worker_reader, initargs=(path,))
+    try:
+        pending = deque()
+        next_page = start_page
+        while next_page < pages or len(pending) > 0:
+            while next_page < pages and len(pending) < max_in_flight:
+                pending.append(executor.submit(extract_worker_page, next_page))
+                next_page += 1
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# The extracted text of a PDF is kept next to it, so reparsing an unchanged file(such as after a parser fix) doesn't
+# have to extract every page again. It's only used if both the file and the pypdf version match what produced it.
+def sidecar_path(path: str) -> str:
+    return path + ".text.json.gz"
+
+
+def load_sidecar(path: str, digest: str):
+    if not exists(sidecar_path(path)):
+        return None
+    try:
+        with gzip.open(sidecar_path(path), "rt", encoding="utf-8") as sidecar_file:
+            sidecar = json.load(sidecar_file)
+    except (OSError, ValueError):
+        return None
+    if sidecar.get("sha256") != digest or sidecar.get("pypdf") != pypdf.__version__:
+        return None
+    return sidecar["pages"]
+
+
+# Passes `pages` through, writing each one to the sidecar as it goes by so the document's text is never held all at
+# once. The sidecar only replaces the old one after the last page, stopping early leaves the old one alone.
+def write_sidecar(path: str, digest: str, pages):
+    temp_path = sidecar_path(path) + ".tmp"
+    try:
+        with gzip.open(temp_path, "wt", encoding="utf-8") as sidecar_file:
+            # The same document json.dump would write, with the pages appended one at a time
+            sidecar_file.write(json.dumps({"sha256": digest, "pypdf": pypdf.__version__})[:-1] + ', "pages": [')
+            for index, page in enumerate(pages):
+                sidecar_file.write((", " if index > 0 else "") + json.dumps(page))
+                yield page
+            sidecar_file.write("]}")
+        os.replace(temp_path, sidecar_path(path))
+    finally:
+        if exists(temp_path):
+            os.remove(temp_path)
+
+
+# Same as iter_page_texts, but served from the sidecar when it's valid and saving one after a full extraction.
+# `digest` skips hashing the file when it's already known, such as from the download. Starting past the first page
+# doesn't save a sidecar, since it would be missing the skipped pages.
+def cached_page_texts(path: str, workers: int = None, digest: str = None, reader: PdfReader = None,
+                      start_page: int = 0):
+    digest = digest or file_hash(path)
+    pages = load_sidecar(path, digest)
+    if pages is not None:
+        yield from pages[start_page:]
+        return
+
+    with closing(iter_page_texts(path, workers, reader=reader, start_page=start_page)) as page_texts:
+        if start_page == 0:
+            with closing(write_sidecar(path, digest, page_texts)) as sidecar_pages:
+                yield from sidecar_pages
+        else:
+            yield from page_texts
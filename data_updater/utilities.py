@@ -1,4 +1,7 @@
-from common.models import ClassSchedule, Instructor
+from common.models import ClassSchedule, Instructor, days_to_mask
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import scoped_session
 from common.database import session_factory
 import re
@@ -37,22 +40,114 @@ def humanize_hour(hour):
     return f"{(hour - 1) % 12 + 1}{'pm' if hour >= 12 else 'am'}"
 
 
+def split_attribute_values(label, value):
+    # Gen ed attributes list several codes in one value(`FC-KNOWING, FC-QUANT`), everything else is kept whole
+    if "Gen Ed" in label:
+        return [code.strip() for code in value.split(",") if len(code.strip()) > 0]
+    return [value]
+
+
+# Only used for matching, names are stored as the source gave them
+def normalize_instructor_name(name):
+    if name is None:
+        return None
+    # The sources aren't consistent about spacing, `Smith,John  A` and `Smith, John A` are the same person
+    name = re.sub(r"\s*,\s*", ",", re.sub(r"\s+", " ", name)).strip()
+    return name if len(name) > 0 else None
+
+
+class InstructorRegistry:
+    """
+    Every instructor is loaded once per session and looked up by normalized (name, type) from then on, so repeat
+    lookups hand back the same object instead of querying again or creating a duplicate row.
+    """
+
+    def __init__(self, db_session):
+        self.db_session = db_session
+        self.instructors = {}
+        # Lookups without a type match an instructor of any type with that name
+        self.by_name = {}
+        self.pending = []
+        # The highest id loaded so far
+        self.last_id = None
+        self.reload()
+
+    # Loads the instructors added since the last time, such as by other processes. Ids only ever grow, so
+    # anything past the highest one seen is new.
+    def reload(self):
+        statement = select(Instructor).order_by(Instructor.id)
+        if self.last_id is not None:
+            statement = statement.where(Instructor.id > self.last_id)
+        for instructor in self.db_session.scalars(statement).all():
+            self.remember(instructor)
+            self.last_id = instructor.id
+
+    def remember(self, instructor):
+        name = normalize_instructor_name(instructor.name)
+        self.instructors.setdefault((name, instructor.instructor_type), instructor)
+        self.by_name.setdefault(name, instructor)
+
+    def get(self, name, type=None):
+        if name == "":
+            name = None
+        key = normalize_instructor_name(name)
+        instructor = self.by_name.get(key) if type is None else self.instructors.get((key, type))
+        if instructor is None:
+            instructor = Instructor(name=name, instructor_type=type)
+            self.remember(instructor)
+            self.pending.append(instructor)
+        return instructor
+
+    # Adds the instructors created since the last flush in one go, call before committing
+    def flush(self):
+        self.db_session.add_all(self.pending)
+        self.pending = []
+
+
+def instructor_registry(db_session):
+    if "instructor_registry" not in db_session.info:
+        db_session.info["instructor_registry"] = InstructorRegistry(db_session)
+    return db_session.info["instructor_registry"]
+
+
 def get_or_create_instructor(db_session, name, type=None):
-    if name == "":
-        name = None
-        
-    instructor = db_session.query(Instructor).filter_by(
-        # I believe this should split the dictionary out into kwargs
-        # This is done so as to only include the instructor_type filter if it was included in the function call
-        # It could certainly be done in a better way, however I don't feel like doing it in said better way
-        **({"name":name, "instructor_type":type} if type is not None else {"name":name})
-        ).first()
-    if instructor is None:
-        instructor = Instructor(
-            name=name,
-            instructor_type=type
-        )
-    return instructor
+    return instructor_registry(db_session).get(name, type)
+
+
+# Sets each of the given attributes that differs from its current value, returning whether anything changed.
+# Untouched attributes aren't marked dirty, so objects whose data didn't change aren't written back at all
+def update_fields(obj, **values):
+    changed = False
+    for key, value in values.items():
+        if getattr(obj, key) != value:
+            setattr(obj, key, value)
+            changed = True
+    return changed
+
+
+# How each backend spells an INSERT that skips rows conflicting with existing ones
+conflict_ignoring_inserts = {
+    "postgresql": lambda model: postgresql.insert(model).on_conflict_do_nothing(),
+    "sqlite": lambda model: sqlite.insert(model).on_conflict_do_nothing(),
+    "mysql": lambda model: mysql.insert(model).prefix_with("IGNORE"),
+    "mariadb": lambda model: mysql.insert(model).prefix_with("IGNORE"),
+}
+
+
+# Inserts plain dict rows in multi-row statements, skipping any that already exist
+def insert_ignoring_conflicts(db_session, model, rows, chunk_size=1000):
+    conflict_ignoring_insert = conflict_ignoring_inserts.get(db_session.get_bind().dialect.name)
+    if conflict_ignoring_insert is None:
+        # Anything else inserts row by row, each in a savepoint so a conflict only undoes that row
+        for row in rows:
+            try:
+                with db_session.begin_nested():
+                    db_session.execute(insert(model).values(row))
+            except IntegrityError:
+                pass
+        return
+    for i in range(0, len(rows), chunk_size):
+        db_session.execute(conflict_ignoring_insert(model).values(rows[i:i + chunk_size]))
 
 
 # translates to 24hr
@@ -88,7 +183,7 @@ def search_to_schedule(db_session, class_data, term):
         days = "TBA"
         start_time = -1
         end_time = -1
-        instructors = [get_or_create_instructor(db_session, "TBA")]
+        schedule_instructors = [get_or_create_instructor(db_session, "TBA")]
     else:
         # convoluted code since T = Tu and TH = Th
         o_days = ["M", "T", "W", "TH", "F"]
@@ -108,7 +203,7 @@ def search_to_schedule(db_session, class_data, term):
         [start_time, end_time] = split_and_translate_time(
             class_data["schedule"][class_data["schedule"].find(" ") + 1:])
 
-        instructors = [get_or_create_instructor(db_session, class_data["primary instructor name(s)"])]
+        schedule_instructors = [get_or_create_instructor(db_session, class_data["primary instructor name(s)"])]
 
     match = re.match(r"""^
     (?P<building>.*)
@@ -121,8 +216,9 @@ def search_to_schedule(db_session, class_data, term):
         room=match.group("room") if match is not None else None,
         class_number=class_number,
         days=days,
+        days_mask=days_to_mask(days),
         start_time=start_time,
         end_time=end_time,
-        instructors=instructors,
+        instructors=schedule_instructors,
         term=term
     )
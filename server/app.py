@@ -1,14 +1,18 @@
 import os
+import hashlib
 from typing import Annotated
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Request, Response
 import datetime
 
-from common.database import init_db, session_factory
+from common.database import init_db, async_session_factory, async_engine
 from common.models import TermData, TermDataSource
 from schema import schema
+from search_index import search_indexes
+from versions import cached_data_version
 from strawberry.fastapi import GraphQLRouter
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 dev_mode = "dev" in os.environ
 
@@ -29,13 +33,68 @@ graphql_app = GraphQLRouter(schema, graphiql=False)
 
 app.include_router(graphql_app, prefix="/graphql")
 
-db_session = session_factory()
+# Responses only change when the updater commits, so clients and the nginx cache can hold on to them briefly
+# and then revalidate against the ETag, which is cheap since the data version is cached in memory(see versions.py)
+cache_control = "public, max-age=60, must-revalidate"
+
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    # Proxies may weaken the tag when they transform the body, which still counts for If-None-Match
+    return any(tag.strip() in ["*", etag, "W/" + etag] for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+@app.middleware("http")
+async def graphql_etag(request: Request, call_next):
+    # Only GET queries are cacheable, POSTs (including every mutation) go straight through
+    if request.method != "GET" or not request.url.path.startswith("/graphql"):
+        return await call_next(request)
+    etag = make_etag(await cached_data_version.get(async_session_factory), request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = cache_control
+    return response
+
+
+@app.on_event("startup")
+async def build_search_indexes():
+    # Postgres has trigram indexes for substring search, other backends build the in-process ones up front
+    # so the first search of each term doesn't pay for it
+    if async_engine.dialect.name != "postgresql":
+        async with async_session_factory() as db_session:
+            for term in (await db_session.scalars(select(TermData.name))).all():
+                await search_indexes.get(db_session, term)
+
+
+async def get_db():
+    async with async_session_factory() as db_session:
+        yield db_session
 
 
 @app.get("/terms")
-async def terms():
+async def terms(request: Request, response: Response, db_session: Annotated[AsyncSession, Depends(get_db)]):
+    # The listed terms depend on the date as well, so the tag changes daily even without new data
+    etag = make_etag(await cached_data_version.get(async_session_factory), datetime.date.today())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
     stmt = select(TermData).where(TermData.sources.any(TermDataSource.last_seen < (datetime.datetime.now() + datetime.timedelta(days=7))))
-    result = db_session.execute(stmt)
+    result = await db_session.execute(stmt)
 
     return [{"name": term.name, "id": term.id} for term in result.scalars()]
 
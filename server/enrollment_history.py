@@ -0,0 +1,68 @@
+import datetime
+import typing
+from collections import defaultdict
+
+from sqlalchemy import select, func, tuple_, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.database import async_engine
+from common.models import ClassEnrollmentStamp
+
+# strftime formats truncating a timestamp to the start of its bucket, for backends without date_trunc
+sqlite_bucket_formats = {
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+}
+
+
+def bucket_start(resolution: str):
+    if async_engine.dialect.name == "postgresql":
+        return func.date_trunc(resolution, ClassEnrollmentStamp.timestamp, type_=DateTime)
+    return func.strftime(sqlite_bucket_formats[resolution], ClassEnrollmentStamp.timestamp, type_=DateTime)
+
+
+# pdf stamps come from the SSB reports, search stamps from the class search, which only knows the open seats and
+# stores them as a negative enrollment_total
+enrollment_sources = ("pdf", "search")
+
+
+# Stamps are only recorded when the numbers change, so a bucket only exists where something changed(or the first
+# time a class was seen) and its numbers hold until the next bucket. Each bucket has the numbers of its latest stamp,
+# since those are the ones that held on, and `last_seen`, the latest time any of its stamps was still current.
+async def enrollment_history(db: AsyncSession, keys: typing.Collection[typing.Tuple[int, str]], resolution: str,
+                             source: str, since: typing.Optional[datetime.datetime] = None,
+                             until: typing.Optional[datetime.datetime] = None) -> typing.Dict[tuple, list]:
+    bucket = bucket_start(resolution)
+    partition = (ClassEnrollmentStamp.class_number, ClassEnrollmentStamp.term, bucket)
+    stamps = select(
+        ClassEnrollmentStamp.class_number,
+        ClassEnrollmentStamp.term,
+        bucket.label("start"),
+        ClassEnrollmentStamp.enrollment_cap,
+        ClassEnrollmentStamp.enrollment_total,
+        ClassEnrollmentStamp.waitlist_cap,
+        ClassEnrollmentStamp.waitlist_total,
+        func.max(func.coalesce(ClassEnrollmentStamp.valid_through, ClassEnrollmentStamp.timestamp,
+                               type_=DateTime)).over(partition_by=partition).label("last_seen"),
+        func.row_number().over(partition_by=partition,
+                               order_by=ClassEnrollmentStamp.timestamp.desc()).label("recency"),
+    ).where(
+        # Served by the primary key, which starts with (class_number, term)
+        tuple_(ClassEnrollmentStamp.term, ClassEnrollmentStamp.class_number).in_(
+            {(term, class_number) for class_number, term in keys}),
+        ClassEnrollmentStamp.source == source,
+    )
+    if since is not None:
+        # A stamp holds until valid_through, so the one in force when the window starts is kept too(with the
+        # bucket it started in)
+        stamps = stamps.where(func.coalesce(ClassEnrollmentStamp.valid_through, ClassEnrollmentStamp.timestamp,
+                                            type_=DateTime) >= since)
+    if until is not None:
+        stamps = stamps.where(ClassEnrollmentStamp.timestamp < until)
+    stamps = stamps.subquery()
+    statement = select(stamps).where(stamps.c.recency == 1).order_by(stamps.c.start)
+
+    history = defaultdict(list)
+    for row in (await db.execute(statement)).all():
+        history[(row.class_number, row.term)].append(row)
+    return history
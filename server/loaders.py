@@ -0,0 +1,93 @@
+import asyncio
+import datetime
+import typing
+from collections import defaultdict
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from strawberry.dataloader import DataLoader
+
+from common.models import Instructor as InstructorModel
+from common.models import ClassSchedule as ClassScheduleModel
+from common.models import CourseAttribute as CourseAttributeModel
+from common.models import Course as CourseModel
+from common.models import ClassReserveCapacity as ClassReserveCapacityModel
+from common.models import schedule_instructor_join_table
+from enrollment_history import enrollment_history
+
+
+# Each loader collects every key requested while resolving one level of the query and
+# then fetches all of them with a single `IN (...)` statement, instead of letting each
+# object lazy load its own relationship.
+
+
+def create_loaders(db: AsyncSession, lock: asyncio.Lock) -> typing.Dict[str, DataLoader]:
+    # Batches for different loaders are dispatched concurrently, but an AsyncSession only
+    # allows one statement in flight at a time, so every load goes through the request's lock
+    async def execute(statement):
+        async with lock:
+            return await db.execute(statement)
+
+    async def load_courses(codes: typing.List[str]) -> typing.List[typing.Optional[CourseModel]]:
+        courses = (await execute(select(CourseModel).where(CourseModel.code.in_(set(codes))))).scalars().all()
+        by_code = {course.code: course for course in courses}
+        return [by_code.get(code) for code in codes]
+
+    async def load_schedules(keys: typing.List[typing.Tuple[int, str]]) -> typing.List[typing.List[ClassScheduleModel]]:
+        schedules = (await execute(select(ClassScheduleModel).where(
+            tuple_(ClassScheduleModel.class_number, ClassScheduleModel.term).in_(set(keys))
+        ).order_by(ClassScheduleModel.id))).scalars().all()
+        by_class = defaultdict(list)
+        for schedule in schedules:
+            by_class[(schedule.class_number, schedule.term)].append(schedule)
+        return [by_class[key] for key in keys]
+
+    async def load_instructors(schedule_ids: typing.List[int]) -> typing.List[typing.List[InstructorModel]]:
+        rows = (await execute(select(schedule_instructor_join_table.c.schedule_id, InstructorModel).join(
+            InstructorModel, InstructorModel.id == schedule_instructor_join_table.c.instructor_id
+        ).where(schedule_instructor_join_table.c.schedule_id.in_(set(schedule_ids))))).all()
+        by_schedule = defaultdict(list)
+        for schedule_id, instructor in rows:
+            by_schedule[schedule_id].append(instructor)
+        return [by_schedule[schedule_id] for schedule_id in schedule_ids]
+
+    async def load_reserve_capacities(keys: typing.List[typing.Tuple[int, str]]) -> typing.List[typing.List[ClassReserveCapacityModel]]:
+        reserve_capacities = (await execute(select(ClassReserveCapacityModel).where(
+            tuple_(ClassReserveCapacityModel.class_number, ClassReserveCapacityModel.term).in_(set(keys))
+        ))).scalars().all()
+        by_class = defaultdict(list)
+        for reserve_capacity in reserve_capacities:
+            by_class[(reserve_capacity.class_number, reserve_capacity.term)].append(reserve_capacity)
+        return [by_class[key] for key in keys]
+
+    async def load_attrs(codes: typing.List[str]) -> typing.List[typing.List[CourseAttributeModel]]:
+        attrs = (await execute(select(CourseAttributeModel).where(
+            CourseAttributeModel.parent_course_code.in_(set(codes))
+        ).order_by(CourseAttributeModel.id))).scalars().all()
+        by_course = defaultdict(list)
+        for attr in attrs:
+            by_course[attr.parent_course_code].append(attr)
+        return [by_course[code] for code in codes]
+
+    return {
+        "course": DataLoader(load_fn=load_courses),
+        "schedules": DataLoader(load_fn=load_schedules),
+        "instructors": DataLoader(load_fn=load_instructors),
+        "reserve_capacities": DataLoader(load_fn=load_reserve_capacities),
+        "attrs": DataLoader(load_fn=load_attrs),
+    }
+
+
+# Enrollment history depends on the field's arguments, so there is a loader per distinct set of them
+def enrollment_history_loader(context: dict, resolution: str, source: str,
+                              since: typing.Optional[datetime.datetime],
+                              until: typing.Optional[datetime.datetime]) -> DataLoader:
+    key = ("enrollment_history", resolution, source, since, until)
+    if key not in context["loaders"]:
+        async def load_enrollment_history(keys: typing.List[typing.Tuple[int, str]]) -> typing.List[list]:
+            async with context["db_lock"]:
+                history = await enrollment_history(context["db"], set(keys), resolution, source, since, until)
+            return [history[class_key] for class_key in keys]
+
+        context["loaders"][key] = DataLoader(load_fn=load_enrollment_history)
+    return context["loaders"][key]
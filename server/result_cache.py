@@ -0,0 +1,52 @@
+import os
+import typing
+from collections import OrderedDict
+
+
+def freeze(value) -> typing.Hashable:
+    # Argument values come in as dicts and lists, order doesn't matter for any of our list filters
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items() if item is not None))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted((freeze(item) for item in value), key=repr))
+    return value
+
+
+# Query results keyed on (term, query key), where the query key should cover the field, its arguments and
+# the selection set. Every entry of a term is dropped as soon as that term's version moves on, so the updater
+# committing new data is the only invalidation needed.
+class TermResultCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, term: str, version, key: typing.Hashable):
+        if self.versions.get(term) != version:
+            self.invalidate(term)
+            self.versions[term] = version
+        value = self.entries.get((term, key))
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((term, key))
+        self.hits += 1
+        return value
+
+    def put(self, term: str, version, key: typing.Hashable, value):
+        # Results computed against an older version than the cache has already seen are not worth keeping
+        if self.versions.get(term) != version:
+            return
+        self.entries[(term, key)] = value
+        self.entries.move_to_end((term, key))
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, term: str):
+        for entry_key in [entry_key for entry_key in self.entries if entry_key[0] == term]:
+            del self.entries[entry_key]
+
+
+result_cache = TermResultCache(int(os.getenv("RESULT_CACHE_SIZE", 1024)))
@@ -0,0 +1,139 @@
+import dataclasses
+import heapq
+import itertools
+import typing
+from collections import defaultdict
+
+# A week is split into 5 minute slots, and each section's meetings are packed into one int with a bit per slot,
+# so checking two sections for a conflict is a single `&`
+slot_minutes = 5
+slots_per_day = 24 * 60 // slot_minutes
+
+# Bounds the work a single request can cause. The search stops after looking at this many complete schedules, in
+# which case the results are the best of the ones it got to rather than of every possible schedule.
+max_candidates = 5000
+
+
+def schedule_occupancy(days_mask: typing.Optional[int], start_time: typing.Optional[int],
+                       end_time: typing.Optional[int]) -> int:
+    # TBA schedules are stored with missing or negative times, and never conflict with anything
+    if not days_mask or start_time is None or end_time is None or start_time < 0 or end_time <= start_time:
+        return 0
+    start_slot = start_time // slot_minutes
+    end_slot = -(-end_time // slot_minutes)
+    day_occupancy = ((1 << (end_slot - start_slot)) - 1) << start_slot
+    occupancy = 0
+    for day in range(7):
+        if days_mask & (1 << day):
+            occupancy |= day_occupancy << (day * slots_per_day)
+    return occupancy
+
+
+@dataclasses.dataclass
+class Section:
+    class_number: int
+    occupancy: int
+    instance: typing.Any = None
+
+
+@dataclasses.dataclass
+class ScheduleRank:
+    days_on_campus: int
+    gap_minutes: int
+    earliest_start: typing.Optional[int]
+
+    def key(self):
+        # Fewer days on campus first, then less time spent waiting between classes, then later mornings
+        return self.days_on_campus, self.gap_minutes, -(self.earliest_start or 0)
+
+
+day_mask = (1 << slots_per_day) - 1
+
+
+def days_on_campus(occupancy: int) -> int:
+    return sum(1 for day in range(7) if (occupancy >> (day * slots_per_day)) & day_mask)
+
+
+def rank(occupancy: int) -> ScheduleRank:
+    days_on_campus = 0
+    gap_slots = 0
+    earliest_start = None
+    for day in range(7):
+        day_occupancy = (occupancy >> (day * slots_per_day)) & day_mask
+        if day_occupancy == 0:
+            continue
+        days_on_campus += 1
+        first_slot = (day_occupancy & -day_occupancy).bit_length() - 1
+        last_slot = day_occupancy.bit_length() - 1
+        gap_slots += (last_slot - first_slot + 1) - day_occupancy.bit_count()
+        earliest_start = first_slot if earliest_start is None else min(earliest_start, first_slot)
+    return ScheduleRank(days_on_campus=days_on_campus, gap_minutes=gap_slots * slot_minutes,
+                        earliest_start=None if earliest_start is None else earliest_start * slot_minutes)
+
+
+def group_sections(sections: typing.Iterable[typing.Tuple[typing.Hashable, Section]],
+                   pinned_class_numbers: typing.Collection[int] = ()) -> typing.List[typing.List[Section]]:
+    # One section has to be picked from every group, and a pinned section replaces the rest of its group
+    groups = defaultdict(list)
+    for group_key, section in sections:
+        groups[group_key].append(section)
+    unknown = set(pinned_class_numbers) - {section.class_number for group in groups.values() for section in group}
+    if len(unknown) > 0:
+        raise ValueError("Pinned classes aren't sections of the requested courses: " +
+                         ", ".join(str(class_number) for class_number in sorted(unknown)))
+    pinned_groups = []
+    for group in groups.values():
+        pinned = [section for section in group if section.class_number in pinned_class_numbers]
+        pinned_groups.append(pinned if len(pinned) > 0 else group)
+    return pinned_groups
+
+
+def generate(groups: typing.List[typing.List[Section]], limit: int) \
+        -> typing.List[typing.Tuple[ScheduleRank, typing.List[Section]]]:
+    if len(groups) == 0 or any(len(group) == 0 for group in groups):
+        return []
+    # Branch on the most constrained groups first so dead ends are found early
+    groups = sorted(groups, key=len)
+
+    # The best `limit` schedules found so far, ranked as they're found. Keys are negated so the top of the heap is
+    # the worst one kept, and the counter keeps ties in the order they were found.
+    best = []
+    found = itertools.count()
+    # (index, occupied) states the remaining groups can't be filled in from, so each dead end is only explored once
+    dead_ends = set()
+    examined = 0
+
+    # Returns whether the remaining groups might still be filled in around what is already occupied
+    def backtrack(index: int, occupied: int, chosen: typing.List[Section]) -> bool:
+        nonlocal examined
+        if index == len(groups):
+            examined += 1
+            schedule_rank = rank(occupied)
+            entry = (tuple(-part for part in schedule_rank.key()), -next(found), schedule_rank, list(chosen))
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+            return True
+        if (index, occupied) in dead_ends:
+            return False
+        completable = False
+        for section in groups[index]:
+            if examined >= max_candidates:
+                return True
+            if section.occupancy & occupied != 0:
+                continue
+            next_occupied = occupied | section.occupancy
+            # Adding sections never takes days off campus, so this branch can't beat any of the schedules kept
+            if len(best) == limit and days_on_campus(next_occupied) > -best[0][0][0]:
+                completable = True
+                continue
+            chosen.append(section)
+            completable |= backtrack(index + 1, next_occupied, chosen)
+            chosen.pop()
+        if not completable:
+            dead_ends.add((index, occupied))
+        return completable
+
+    backtrack(0, 0, [])
+    return [(schedule_rank, sections) for _, _, schedule_rank, sections in sorted(best, reverse=True)]
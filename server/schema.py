@@ -1,24 +1,53 @@
+import asyncio
+import base64
 import datetime
+import enum
+import functools
+import json
+import operator
+import os
+import re
 import typing
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, select, inspect, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, load_only
 
-from common.database import session_factory
+from common.database import async_session_factory, async_engine
 from common.models import Instructor as InstructorModel
 from common.models import Class as ClassModel
 from common.models import ClassSchedule as ClassScheduleModel
 from common.models import CourseAttribute as CourseAttributeModel
 from common.models import Course as CourseModel
 from common.models import ClassReserveCapacity as ClassReserveCapacityModel
+from common.models import Attribute as AttributeModel
+from common.models import TermAttributeBitmap as TermAttributeBitmapModel
+from common.models import TermClassIndex as TermClassIndexModel
+from common.models import days_to_mask, weekdays_mask
+from loaders import create_loaders, enrollment_history_loader
+from enrollment_history import enrollment_history, enrollment_sources
+from search_index import TermSearchIndex, search_indexes
+from result_cache import result_cache, freeze
+from versions import term_version
+import schedule_generator
 
 import strawberry
 from strawberry.extensions import Extension
+from strawberry.types.nodes import SelectedField
+
+
+def is_loaded(instance, attribute: str) -> bool:
+    return attribute not in inspect(instance).unloaded
+
+
+def loaded_values(instance, attributes: typing.List[str]) -> typing.Dict[str, typing.Any]:
+    # Columns left out by load_only are filled with None rather than lazy loaded, since they were not requested
+    unloaded = inspect(instance).unloaded
+    return {attribute: None if attribute in unloaded else getattr(instance, attribute) for attribute in attributes}
 
 
 @strawberry.type
 class Instructor:
-    instance: strawberry.Private[InstructorModel]
     id: int
     instructor_type: typing.Optional[str]
     name: str
@@ -26,20 +55,61 @@ class Instructor:
     @classmethod
     def from_instance(cls, instance: InstructorModel):
         return cls(
-            instance=instance,
             id=instance.id,
             instructor_type=instance.instructor_type,
             name=instance.name,
         )
 
 
+def check_enrollment_source(source: str):
+    if source not in enrollment_sources:
+        raise ValueError(f"`source` must be one of {', '.join(enrollment_sources)}")
+
+
+@strawberry.enum
+class EnrollmentResolution(enum.Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
+@strawberry.type
+class EnrollmentBucket:
+    start: datetime.datetime
+    # the last time the bucket's numbers were seen, they hold until the next bucket starts
+    last_seen: datetime.datetime
+    enrollment_cap: typing.Optional[int]
+    enrollment_total: typing.Optional[int]
+    waitlist_cap: typing.Optional[int]
+    waitlist_total: typing.Optional[int]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            start=row.start,
+            last_seen=row.last_seen,
+            enrollment_cap=row.enrollment_cap,
+            enrollment_total=row.enrollment_total,
+            waitlist_cap=row.waitlist_cap,
+            waitlist_total=row.waitlist_total,
+        )
+
+
+# The types only hold plain values copied out of the ORM instances, never the instances themselves, since the
+# result cache hands them out again long after the session that loaded them is closed. Relationships loaded along
+# with an instance are converted with it, the `loaded_*` fields are None for the rest and their resolvers go
+# through the current request's loaders instead.
 @strawberry.type
 class Class:
-    instance: strawberry.Private[ClassModel]
+    course_id: strawberry.Private[str]
+    loaded_course: strawberry.Private[typing.Optional["Course"]]
+    loaded_schedules: strawberry.Private[typing.Optional[typing.List["ClassSchedule"]]]
+    loaded_reserve_capacities: strawberry.Private[typing.Optional[typing.List["ClassReserveCapacity"]]]
 
     @strawberry.field
-    def course(self) -> "Course":
-        return Course.from_instance(self.instance.course)
+    async def course(self, info) -> "Course":
+        if self.loaded_course is not None:
+            return self.loaded_course
+        return Course.from_instance(await info.context["loaders"]["course"].load(self.course_id))
 
     class_section: str
     class_number: int
@@ -52,8 +122,11 @@ class Class:
     instruction_type: str
 
     @strawberry.field
-    def schedules(self) -> typing.List["ClassSchedule"]:
-        return [ClassSchedule.from_instance(schedule) for schedule in self.instance.schedules]
+    async def schedules(self, info) -> typing.List["ClassSchedule"]:
+        if self.loaded_schedules is not None:
+            return self.loaded_schedules
+        schedules = await info.context["loaders"]["schedules"].load((self.class_number, self.term))
+        return [ClassSchedule.from_instance(schedule) for schedule in schedules]
 
     enrollment_cap: typing.Optional[int]
     enrollment_total: int
@@ -64,57 +137,74 @@ class Class:
     equivalents: str
 
     @strawberry.field
-    def reserve_capacities(self) -> typing.List["ClassReserveCapacity"]:
-        return [ClassReserveCapacity.from_instance(reserve_capacity) for reserve_capacity in self.instance.reserve_capacities]
+    async def reserve_capacities(self, info) -> typing.List["ClassReserveCapacity"]:
+        if self.loaded_reserve_capacities is not None:
+            return self.loaded_reserve_capacities
+        reserve_capacities = await info.context["loaders"]["reserve_capacities"].load((self.class_number, self.term))
+        return [ClassReserveCapacity.from_instance(reserve_capacity) for reserve_capacity in reserve_capacities]
+
+    # `source` is pdf or search, search stamps only know the open seats and store them as a negative enrollment_total
+    @strawberry.field
+    async def enrollment_history(self, info,
+                                 resolution: EnrollmentResolution = EnrollmentResolution.DAY,
+                                 source: str = "pdf",
+                                 since: typing.Optional[datetime.datetime] = None,
+                                 until: typing.Optional[datetime.datetime] = None) -> typing.List["EnrollmentBucket"]:
+        check_enrollment_source(source)
+        loader = enrollment_history_loader(info.context, resolution.value, source, since, until)
+        rows = await loader.load((self.class_number, self.term))
+        return [EnrollmentBucket.from_row(row) for row in rows]
     last_updated_at: datetime.datetime
     last_updated_from: str
 
     @classmethod
     def from_instance(cls, instance: ClassModel):
+        # class_number and term are the primary key, so they are loaded even when they weren't selected
         return cls(
-            instance=instance,
-            class_section=instance.class_section,
-            class_number=instance.class_number,
-            title=instance.title,
-            component=instance.component,
-            topics=instance.topics,
-            term=instance.term,
-            units=instance.units,
-            meeting_dates=instance.meeting_dates,
-            instruction_type=instance.instruction_type,
-            enrollment_cap=instance.enrollment_cap,
-            enrollment_total=instance.enrollment_total,
-            waitlist_cap=instance.waitlist_cap,
-            waitlist_total=instance.waitlist_total,
-            min_enrollment=instance.min_enrollment,
-            combined_section_id=instance.combined_section_id,
-            equivalents=instance.equivalents,
-            last_updated_at=instance.last_updated_at,
-            last_updated_from=instance.last_updated_from,
+            course_id=instance.course_id,
+            loaded_course=Course.from_instance(instance.course) if is_loaded(instance, "course") else None,
+            loaded_schedules=[ClassSchedule.from_instance(schedule) for schedule in instance.schedules]
+            if is_loaded(instance, "schedules") else None,
+            loaded_reserve_capacities=[ClassReserveCapacity.from_instance(reserve_capacity)
+                                       for reserve_capacity in instance.reserve_capacities]
+            if is_loaded(instance, "reserve_capacities") else None,
+            **loaded_values(instance, ["class_section", "class_number", "title", "component", "topics", "term",
+                                       "units", "meeting_dates", "instruction_type", "enrollment_cap",
+                                       "enrollment_total", "waitlist_cap", "waitlist_total", "min_enrollment",
+                                       "combined_section_id", "equivalents", "last_updated_at",
+                                       "last_updated_from"])
         )
 
 
 @strawberry.type
 class ClassSchedule:
-    instance: strawberry.Private[ClassScheduleModel]
+    id: strawberry.Private[int]
+    loaded_instructors: strawberry.Private[typing.Optional[typing.List["Instructor"]]]
     building: typing.Optional[str]
     room: typing.Optional[str]
 
     @strawberry.field
-    def instructors(self) -> typing.List["Instructor"]:
-        return [Instructor.from_instance(instructor) for instructor in self.instance.instructors]
+    async def instructors(self, info) -> typing.List["Instructor"]:
+        if self.loaded_instructors is not None:
+            return self.loaded_instructors
+        instructors = await info.context["loaders"]["instructors"].load(self.id)
+        return [Instructor.from_instance(instructor) for instructor in instructors]
 
     days: str
+    days_mask: typing.Optional[int]
     start_time: typing.Optional[int]
     end_time: typing.Optional[int]
 
     @classmethod
     def from_instance(cls, instance: ClassScheduleModel):
         return cls(
-            instance=instance,
+            id=instance.id,
+            loaded_instructors=[Instructor.from_instance(instructor) for instructor in instance.instructors]
+            if is_loaded(instance, "instructors") else None,
             building=instance.building,
             room=instance.room,
             days=instance.days,
+            days_mask=instance.days_mask,
             start_time=instance.start_time,
             end_time=instance.end_time,
         )
@@ -122,14 +212,12 @@ class ClassSchedule:
 
 @strawberry.type
 class CourseAttribute:
-    instance: strawberry.Private[CourseAttributeModel]
     label: str
     value: str
 
     @classmethod
     def from_instance(cls, instance: CourseAttributeModel):
         return cls(
-            instance=instance,
             label=instance.label,
             value=instance.value,
         )
@@ -137,15 +225,18 @@ class CourseAttribute:
 
 @strawberry.type
 class Course:
-    instance: strawberry.Private[CourseModel]
+    loaded_attrs: strawberry.Private[typing.Optional[typing.List["CourseAttribute"]]]
     code: str
     title: str
     credits: str
     description: typing.Optional[str]
 
     @strawberry.field
-    def attrs(self) -> typing.List["CourseAttribute"]:
-        return [CourseAttribute.from_instance(attr) for attr in self.instance.attrs]
+    async def attrs(self, info) -> typing.List["CourseAttribute"]:
+        if self.loaded_attrs is not None:
+            return self.loaded_attrs
+        attrs = await info.context["loaders"]["attrs"].load(self.code)
+        return [CourseAttribute.from_instance(attr) for attr in attrs]
 
     last_updated_at: datetime.datetime
     last_updated_from: str
@@ -153,20 +244,15 @@ class Course:
     @classmethod
     def from_instance(cls, instance: CourseModel):
         return cls(
-            instance=instance,
-            code=instance.code,
-            title=instance.title,
-            credits=instance.credits,
-            description=instance.description,
-            last_updated_at=instance.last_updated_at,
-            last_updated_from=instance.last_updated_from,
+            loaded_attrs=[CourseAttribute.from_instance(attr) for attr in instance.attrs]
+            if is_loaded(instance, "attrs") else None,
+            **loaded_values(instance, ["code", "title", "credits", "description", "last_updated_at",
+                                       "last_updated_from"])
         )
 
 
 @strawberry.type
 class ClassReserveCapacity:
-    instance: strawberry.Private[ClassReserveCapacityModel]
-
     expire_date: datetime.datetime
     description: str
     enroll_cap: int
@@ -175,7 +261,6 @@ class ClassReserveCapacity:
     @classmethod
     def from_instance(cls, instance: ClassReserveCapacityModel):
         return cls(
-            instance=instance,
             expire_date=instance.expire_date,
             description=instance.description,
             enroll_cap=instance.enroll_cap,
@@ -186,22 +271,262 @@ class ClassReserveCapacity:
 
 # hardcoding the query limit for now, if the service is performing well enough
 #      then I may consider upping the limit
+# classesConnection uses it as the default page size and can be paged through instead
 query_limit = 50
+max_page_size = 200
+
+# Pages are ordered by these columns, class_number breaks ties between sections so the order is total
+class_cursor_columns = (ClassModel.course_id, ClassModel.class_section, ClassModel.class_number)
+
+
+def encode_class_cursor(class_obj: ClassModel) -> str:
+    return base64.urlsafe_b64encode(json.dumps(
+        [class_obj.course_id, class_obj.class_section, class_obj.class_number]).encode()).decode()
+
+
+def decode_class_cursor(cursor: str) -> typing.List:
+    try:
+        course_id, class_section, class_number = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor `{cursor}`")
+    return [course_id, class_section, class_number]
+
+
+def to_snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+def selected_fields(selections) -> typing.Dict[str, list]:
+    # Flattens fragments and maps the camelCase GraphQL field names back to model attribute names,
+    # keeping the sub-selections of each field so nested types can be inspected the same way
+    fields = {}
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            fields.setdefault(to_snake_case(selection.name), []).extend(selection.selections)
+        else:
+            for name, sub_selections in selected_fields(selection.selections).items():
+                fields.setdefault(name, []).extend(sub_selections)
+    return fields
+
+
+def selection_key(selections) -> typing.Hashable:
+    return tuple(sorted((name, selection_key(sub_selections))
+                        for name, sub_selections in selected_fields(selections).items()))
+
+
+def cache_key(info) -> typing.Hashable:
+    # The same arguments with a different selection set load different columns and relationships
+    return (info.field_name, freeze(info.selected_fields[0].arguments),
+            selection_key(info.selected_fields[0].selections))
+
+
+def requested_columns(model, fields: typing.Dict[str, list]) -> list:
+    columns = inspect(model).column_attrs.keys()
+    return [getattr(model, name) for name in fields if name in columns]
+
+
+def class_load_options(selections, extra_columns=()) -> list:
+    # Only hydrate the columns and relationships the client actually asked for
+    fields = selected_fields(selections)
+    options = [load_only(ClassModel.course_id, *extra_columns, *requested_columns(ClassModel, fields))]
+    if "course" in fields:
+        course_fields = selected_fields(fields["course"])
+        # The primary key is always loaded, the selection may only ask for relationships such as attrs
+        course_options = [load_only(CourseModel.code, *requested_columns(CourseModel, course_fields))]
+        if "attrs" in course_fields:
+            course_options.append(selectinload(CourseModel.attrs))
+        # Many-to-one, so joining it in is cheaper than a second round trip
+        options.append(joinedload(ClassModel.course).options(*course_options))
+    if "schedules" in fields:
+        if "instructors" in selected_fields(fields["schedules"]):
+            options.append(selectinload(ClassModel.schedules).selectinload(ClassScheduleModel.instructors))
+        else:
+            options.append(selectinload(ClassModel.schedules))
+    if "reserve_capacities" in fields:
+        options.append(selectinload(ClassModel.reserve_capacities))
+    return options
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: typing.Optional[str]
+
+
+@strawberry.type
+class ClassEdge:
+    cursor: str
+    node: Class
+
+
+@strawberry.type
+class ClassConnection:
+    edges: typing.List[ClassEdge]
+    page_info: PageInfo
+
+
+@strawberry.type
+class GeneratedSchedule:
+    classes: typing.List[Class]
+    days_on_campus: int
+    # time spent between classes on the days with classes, in minutes
+    gap_minutes: int
+    # in minutes since midnight
+    earliest_start: typing.Optional[int]
+
+
+@strawberry.type
+class ClassEnrollmentHistory:
+    class_number: int
+    term: str
+    buckets: typing.List[EnrollmentBucket]
+
+
+# The generator is bounded by schedule_generator.max_candidates, this only bounds the response size
+max_generated_schedules = 50
 
 
 class SQLAlchemySession(Extension):
     def on_request_start(self):
-        self.execution_context.context["db"] = session_factory()
-
-    def on_request_end(self):
-        self.execution_context.context["db"].close()
+        self.execution_context.context["db"] = async_session_factory()
+        # Resolvers run concurrently but the session can only run one statement at a time
+        self.execution_context.context["db_lock"] = asyncio.Lock()
+        # Loaders cache per request, so they are created alongside the session they query through
+        self.execution_context.context["loaders"] = create_loaders(self.execution_context.context["db"],
+                                                                   self.execution_context.context["db_lock"])
+
+    async def on_request_end(self):
+        await self.execution_context.context["db"].close()
+
+
+# Postgres serves the substring filters from its trigram indexes, anything else uses the in-process index
+use_search_index = async_engine.dialect.name != "postgresql"
+# Past this many matches, filters that would otherwise become a list of class numbers(the in-process search index
+# and the attribute bitmaps) are left to the database instead. Very short searches and common attributes match most
+# of the term, and binding every one of those class numbers can run past SQLite's limit on bound parameters.
+max_search_matches = int(os.getenv("MAX_SEARCH_MATCHES", 500))
+
+
+def contains(search_index: typing.Optional[TermSearchIndex], field: str, value: str):
+    if search_index is not None:
+        class_numbers = search_index.search(field, value)
+        if len(class_numbers) <= max_search_matches:
+            return ClassModel.class_number.in_(class_numbers)
+    return getattr(ClassModel, field).ilike(f"%{value}%")
+
+
+async def attribute_filter(db: AsyncSession, term: str, attrs: typing.List[str]):
+    # Classes must have every requested attribute, values shared by several labels match any of them
+    bitmaps = {attr: 0 for attr in attrs}
+    for value, bitmap in (await db.execute(select(AttributeModel.value, TermAttributeBitmapModel.bitmap).join(
+            TermAttributeBitmapModel, TermAttributeBitmapModel.attribute_id == AttributeModel.id).where(
+            TermAttributeBitmapModel.term == term, AttributeModel.value.in_(attrs)))).all():
+        bitmaps[value] |= TermAttributeBitmapModel.decode(bitmap)
+    matched = functools.reduce(operator.and_, bitmaps.values())
+    class_index = await db.scalar(select(TermClassIndexModel.class_numbers).where(TermClassIndexModel.term == term))
+    if class_index is not None and matched.bit_count() <= max_search_matches:
+        class_numbers = TermClassIndexModel.decode(class_index)
+        return ClassModel.class_number.in_(
+            [class_numbers[ordinal] for ordinal in TermAttributeBitmapModel.ordinals(matched)])
+    # Too many to list(or the term's index isn't built yet), so the database joins through the attributes instead
+    return and_(*[ClassModel.course.has(CourseModel.attributes.any(AttributeModel.value == attr)) for attr in attrs])
+
+
+async def filter_classes(db: AsyncSession, statement, term: str,
+                         class_numbers: typing.Optional[typing.List[int]] = None,
+                         course_id: typing.Optional[str] = None,
+                         title: typing.Optional[str] = None,
+                         class_section: typing.Optional[str] = None,
+                         component: typing.Optional[str] = None,
+                         instruction_type: typing.Optional[str] = None,
+                         attrs: typing.Optional[typing.List[str]] = None,
+                         instructor: typing.Optional[str] = None,
+                         days: typing.Optional[typing.List[str]] = None,
+                         starts_after: typing.Optional[int] = None,
+                         ends_before: typing.Optional[int] = None):
+    search_index = None
+    if use_search_index and (course_id is not None or title is not None or class_section is not None):
+        search_index = await search_indexes.get(db, term)
+    if class_numbers is not None:
+        statement = statement.where(ClassModel.class_number.in_(class_numbers))
+    if course_id is not None:
+        statement = statement.where(contains(search_index, "course_id", course_id))
+    if title is not None:
+        statement = statement.where(contains(search_index, "title", title))
+    if class_section is not None:
+        statement = statement.where(contains(search_index, "class_section", class_section))
+    if component is not None:
+        statement = statement.where(ClassModel.component == component)
+    if instruction_type is not None:
+        statement = statement.where(ClassModel.instruction_type == instruction_type)
+    if attrs is not None and len(attrs) > 0:
+        statement = statement.where(await attribute_filter(db, term, attrs))
+    if instructor is not None:
+        statement = statement.where(ClassModel.schedules.any(
+            ClassScheduleModel.instructors.any(InstructorModel.name == instructor)
+        ))
+    if days is not None:
+        # TODO: change it to where it returns any class where all the schedules match exactly
+        # build a mask of the weekdays that weren't asked for, so for a filter allowing Tu, Th, F it has M, W
+        # filter for classes where there is not a schedule that meets on any of those days
+        # weekends are never ruled out, the same as when this was a LIKE over the weekdays
+        disallowed_mask = weekdays_mask & ~days_to_mask("".join(days))
+        statement = statement.where(~ClassModel.schedules.any(
+            ClassScheduleModel.days_mask.bitwise_and(disallowed_mask) != 0
+        ))
+    if starts_after is not None:
+        # times are in minutes since midnight, the same as the schedule columns
+        # filter for classes where there is not a schedule that starts before the desired time
+        statement = statement.where(~ClassModel.schedules.any(
+            ClassScheduleModel.start_time < starts_after
+        ))
+    if ends_before is not None:
+        # filter for classes where there is not a schedule that ends after the desired time
+        statement = statement.where(~ClassModel.schedules.any(
+            ClassScheduleModel.end_time > ends_before
+        ))
+    return statement
 
 
 @strawberry.type
 class Query:
     @strawberry.field(name="classes")
-    def classes(self, info,
+    async def classes(self, info,
+                term: str,
+                class_numbers: typing.Optional[typing.List[int]] = None,
+                course_id: typing.Optional[str] = None,
+                title: typing.Optional[str] = None,
+                class_section: typing.Optional[str] = None,
+                component: typing.Optional[str] = None,
+                instruction_type: typing.Optional[str] = None,
+                attrs: typing.Optional[typing.List[str]] = None,
+                instructor: typing.Optional[str] = None,
+                days: typing.Optional[typing.List[str]] = None,
+                starts_after: typing.Optional[int] = None,
+                ends_before: typing.Optional[int] = None) -> typing.List["Class"]:
+        db: AsyncSession = info.context["db"]
+        async with info.context["db_lock"]:
+            version = await term_version(db, term)
+        cached = result_cache.get(term, version, cache_key(info))
+        if cached is not None:
+            return cached
+        statement = select(ClassModel).where(ClassModel.term == term).\
+            limit(query_limit).order_by(ClassModel.course_id, ClassModel.class_section).\
+            options(*class_load_options(info.selected_fields[0].selections))
+        async with info.context["db_lock"]:
+            statement = await filter_classes(db, statement, term, class_numbers, course_id, title, class_section,
+                                             component, instruction_type, attrs, instructor, days, starts_after,
+                                             ends_before)
+            result = await db.execute(statement)
+        classes = [Class.from_instance(class_obj) for class_obj in result.scalars().all()]
+        result_cache.put(term, version, cache_key(info), classes)
+        return classes
+
+    @strawberry.field(name="classesConnection")
+    async def classes_connection(self, info,
                 term: str,
+                first: int = query_limit,
+                after: typing.Optional[str] = None,
                 class_numbers: typing.Optional[typing.List[int]] = None,
                 course_id: typing.Optional[str] = None,
                 title: typing.Optional[str] = None,
@@ -211,54 +536,106 @@ class Query:
                 attrs: typing.Optional[typing.List[str]] = None,
                 instructor: typing.Optional[str] = None,
                 days: typing.Optional[typing.List[str]] = None,
-                starts_after: typing.Optional[str] = None,
-                ends_before: typing.Optional[str] = None) -> typing.List["Class"]:
-        db: Session = info.context["db"]
+                starts_after: typing.Optional[int] = None,
+                ends_before: typing.Optional[int] = None) -> ClassConnection:
+        if first < 1 or first > max_page_size:
+            raise ValueError(f"`first` must be between 1 and {max_page_size}")
+        db: AsyncSession = info.context["db"]
+        async with info.context["db_lock"]:
+            version = await term_version(db, term)
+        cached = result_cache.get(term, version, cache_key(info))
+        if cached is not None:
+            return cached
+        node_selections = selected_fields(selected_fields(info.selected_fields[0].selections).get("edges", [])).get("node", [])
+        # Fetch one extra row to find out whether there is another page without a separate count query
         statement = select(ClassModel).where(ClassModel.term == term).\
-            limit(query_limit).order_by(ClassModel.course_id, ClassModel.class_section)
-        if class_numbers is not None:
-            statement = statement.where(ClassModel.class_number.in_(class_numbers))
-        if course_id is not None:
-            statement = statement.where(ClassModel.course_id.ilike(f"%{course_id}%"))
-        if title is not None:
-            statement = statement.where(ClassModel.title.ilike(f"%{title}%"))
-        if class_section is not None:
-            statement = statement.where(ClassModel.class_section.ilike(f"%{class_section}%"))
-        if component is not None:
-            statement = statement.where(ClassModel.component == component)
-        if instruction_type is not None:
-            statement = statement.where(ClassModel.instruction_type == instruction_type)
-        if attrs is not None:
-            # TODO: Change to match all attrs
-            statement = statement.where(ClassModel.attributes.any(CourseAttributeModel.value.in_(attrs)))
-        if instructor is not None:
-            statement = statement.where(ClassModel.schedules.any(
-                ClassScheduleModel.instructors.any(InstructorModel.name == instructor)
-            ))
-        if days is not None:
-            valid_days = ["M", "Tu", "W", "Th", "F"]
-            string_search = ""
-            for day in valid_days:
-                if day not in days:
-                    string_search += f"%{day}%"
-
-            # TODO: change it to where it returns any class where all the schedules match exactly
-            # built a string along the like of "%M%%W%" for a filter allowing Tu, Th, F
-            # filter for classes where there is not a schedule that fits the inverted filter
-            statement = statement.where(~ClassModel.schedules.any(
-                ClassScheduleModel.days.like(string_search)
-            ))
-        if starts_after is not None:
-            # filter for classes where there is not a schedule that starts before the desired time
-            statement = statement.where(~ClassModel.schedules.any(
-                ClassScheduleModel.start_time < starts_after
-            ))
-        if ends_before is not None:
-            # filter for classes where there is not a schedule that ends after the desired time
-            statement = statement.where(~ClassModel.schedules.any(
-                ClassScheduleModel.end_time > ends_before
-            ))
-        return [Class.from_instance(class_obj) for class_obj in db.execute(statement).scalars().all()]
+            limit(first + 1).order_by(*class_cursor_columns).\
+            options(*class_load_options(node_selections, class_cursor_columns))
+        if after is not None:
+            # Seek past the cursor rather than using OFFSET so later pages cost the same as the first
+            statement = statement.where(tuple_(*class_cursor_columns) > tuple_(*decode_class_cursor(after)))
+        async with info.context["db_lock"]:
+            statement = await filter_classes(db, statement, term, class_numbers, course_id, title, class_section,
+                                             component, instruction_type, attrs, instructor, days, starts_after,
+                                             ends_before)
+            result = await db.execute(statement)
+        class_objs = result.scalars().all()
+        edges = [ClassEdge(cursor=encode_class_cursor(class_obj), node=Class.from_instance(class_obj))
+                 for class_obj in class_objs[:first]]
+        connection = ClassConnection(edges=edges, page_info=PageInfo(
+            has_next_page=len(class_objs) > first,
+            end_cursor=edges[-1].cursor if len(edges) > 0 else None,
+        ))
+        result_cache.put(term, version, cache_key(info), connection)
+        return connection
+
+    @strawberry.field(name="generateSchedules")
+    async def generate_schedules(self, info,
+                term: str,
+                course_ids: typing.List[str],
+                pinned_class_numbers: typing.Optional[typing.List[int]] = None,
+                limit: int = 10) -> typing.List[GeneratedSchedule]:
+        if limit < 1 or limit > max_generated_schedules:
+            raise ValueError(f"`limit` must be between 1 and {max_generated_schedules}")
+        db: AsyncSession = info.context["db"]
+        class_selections = selected_fields(info.selected_fields[0].selections).get("classes", [])
+        # Schedules are always needed to work out conflicts, whether or not they were requested
+        statement = select(ClassModel).where(ClassModel.term == term, ClassModel.course_id.in_(course_ids)).\
+            options(*class_load_options(class_selections, (ClassModel.component,)),
+                    selectinload(ClassModel.schedules))
+        async with info.context["db_lock"]:
+            result = await db.execute(statement)
+        class_objs = result.scalars().all()
+
+        # Every requested course needs one section of each of its components(lecture, recitation, ...)
+        if set(course_ids) - {class_obj.course_id for class_obj in class_objs}:
+            return []
+        sections = []
+        for class_obj in class_objs:
+            occupancy = 0
+            for schedule in class_obj.schedules:
+                occupancy |= schedule_generator.schedule_occupancy(schedule.days_mask, schedule.start_time,
+                                                                   schedule.end_time)
+            sections.append(((class_obj.course_id, class_obj.component), schedule_generator.Section(
+                class_number=class_obj.class_number, occupancy=occupancy, instance=class_obj)))
+        groups = schedule_generator.group_sections(sections, pinned_class_numbers or ())
+        # The search is CPU bound, so it runs on a worker thread rather than holding up the event loop
+        generated = await asyncio.get_running_loop().run_in_executor(None, schedule_generator.generate, groups, limit)
+
+        return [GeneratedSchedule(
+            classes=[Class.from_instance(section.instance) for section in sections],
+            days_on_campus=schedule_rank.days_on_campus,
+            gap_minutes=schedule_rank.gap_minutes,
+            earliest_start=schedule_rank.earliest_start,
+        ) for schedule_rank, sections in generated]
+
+    @strawberry.field(name="enrollmentHistory")
+    async def enrollment_history(self, info,
+                term: str,
+                class_numbers: typing.List[int],
+                resolution: EnrollmentResolution = EnrollmentResolution.DAY,
+                source: str = "pdf",
+                since: typing.Optional[datetime.datetime] = None,
+                until: typing.Optional[datetime.datetime] = None) -> typing.List[ClassEnrollmentHistory]:
+        if len(class_numbers) > max_page_size:
+            raise ValueError(f"At most {max_page_size} class numbers can be requested at once")
+        check_enrollment_source(source)
+        db: AsyncSession = info.context["db"]
+        async with info.context["db_lock"]:
+            version = await term_version(db, term)
+        cached = result_cache.get(term, version, cache_key(info))
+        if cached is not None:
+            return cached
+        async with info.context["db_lock"]:
+            history = await enrollment_history(db, {(class_number, term) for class_number in class_numbers},
+                                               resolution.value, source, since, until)
+        histories = [ClassEnrollmentHistory(
+            class_number=class_number,
+            term=term,
+            buckets=[EnrollmentBucket.from_row(row) for row in history[(class_number, term)]],
+        ) for class_number in class_numbers]
+        result_cache.put(term, version, cache_key(info), histories)
+        return histories
 
 
 schema = strawberry.Schema(Query, extensions=[SQLAlchemySession])
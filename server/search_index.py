@@ -0,0 +1,73 @@
+import asyncio
+import typing
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.models import Class as ClassModel
+from versions import term_version
+
+
+# Postgres answers the substring filters from pg_trgm GIN indexes (see init_db), other backends
+# would scan the whole class table for every `ilike('%x%')`, so they get an in-process equivalent:
+# an inverted index from every n-gram of a value to the class numbers whose value contains it.
+class NgramIndex:
+    def __init__(self, values: typing.Dict[int, str], n: int = 3):
+        self.n = n
+        self.values = {key: (value or "").lower() for key, value in values.items()}
+        self.postings = defaultdict(set)
+        for key, value in self.values.items():
+            for gram in self.grams(value):
+                self.postings[gram].add(key)
+
+    def grams(self, value: str) -> typing.Set[str]:
+        return {value[i:i + self.n] for i in range(len(value) - self.n + 1)}
+
+    def search(self, substring: str) -> typing.Set[int]:
+        substring = substring.lower()
+        grams = self.grams(substring)
+        if len(grams) == 0:
+            # Too short to have any n-grams, but then the value list is cheap enough to check directly
+            return {key for key, value in self.values.items() if substring in value}
+        candidates = set.intersection(*[self.postings.get(gram, set()) for gram in grams])
+        # Sharing every n-gram doesn't guarantee they appear in order, so confirm against the value
+        return {key for key in candidates if substring in self.values[key]}
+
+
+class TermSearchIndex:
+    fields = ("course_id", "title", "class_section")
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.indexes = {field: NgramIndex({row.class_number: getattr(row, field) for row in rows})
+                        for field in self.fields}
+
+    def search(self, field: str, substring: str) -> typing.Set[int]:
+        return self.indexes[field].search(substring)
+
+
+class SearchIndexes:
+    def __init__(self):
+        self.terms: typing.Dict[str, TermSearchIndex] = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, db: AsyncSession, term: str) -> TermSearchIndex:
+        version = await term_version(db, term)
+        index = self.terms.get(term)
+        if index is None or index.version != version:
+            async with self.lock:
+                index = self.terms.get(term)
+                # Another request may have rebuilt it while this one was waiting
+                if index is None or index.version != version:
+                    index = await self.build(db, term, version)
+        return index
+
+    async def build(self, db: AsyncSession, term: str, version) -> TermSearchIndex:
+        rows = (await db.execute(select(ClassModel.class_number, *[getattr(ClassModel, field) for field in TermSearchIndex.fields])
+                                 .where(ClassModel.term == term))).all()
+        self.terms[term] = TermSearchIndex(version, rows)
+        return self.terms[term]
+
+
+search_indexes = SearchIndexes()
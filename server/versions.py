@@ -0,0 +1,51 @@
+import asyncio
+import datetime
+import os
+import time
+import typing
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.models import TermDataSource, TermClassIndex
+
+
+# Term data only changes when the updater commits, which always advances `last_updated` on the
+# source it came from, so the newest `last_updated` across a term's sources works as its version.
+# The attribute bitmaps are rebuilt after the sources commit, so when they were last rebuilt is part of it too.
+async def term_version(db: AsyncSession, term: str) -> typing.Tuple[typing.Optional[datetime.datetime], ...]:
+    return tuple((await db.execute(select(
+        select(func.max(TermDataSource.last_updated)).where(TermDataSource.term_name == term).scalar_subquery(),
+        select(TermClassIndex.built_at).where(TermClassIndex.term == term).scalar_subquery(),
+    ))).one())
+
+
+# Version of everything the updater has written, for responses that aren't tied to a single term
+async def data_version(db: AsyncSession) -> typing.List[typing.Tuple]:
+    return [tuple(row) for row in (await db.execute(select(
+        TermDataSource.id, TermDataSource.last_updated, TermDataSource.last_seen).order_by(TermDataSource.id))).all()] + \
+        [tuple(row) for row in (await db.execute(select(
+            TermClassIndex.term, TermClassIndex.built_at).order_by(TermClassIndex.term))).all()]
+
+
+# The updater runs in its own process and can't tell the server when it commits, so the version used for ETags is
+# re-read at most every `ttl` seconds and shared by every request in between. Responses are held for a minute by
+# clients anyway, a tag lagging the data by a few seconds only costs them one extra full response.
+class CachedDataVersion:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.value = None
+        self.read_at = None
+        self.lock = asyncio.Lock()
+
+    async def get(self, session_factory) -> typing.List[typing.Tuple]:
+        # Requests arriving while the version is being read wait for that read instead of starting their own
+        async with self.lock:
+            if self.read_at is None or time.monotonic() - self.read_at >= self.ttl:
+                async with session_factory() as db:
+                    self.value = await data_version(db)
+                self.read_at = time.monotonic()
+            return self.value
+
+
+cached_data_version = CachedDataVersion(float(os.getenv("DATA_VERSION_TTL", 5)))
@@ -0,0 +1,36 @@
+import asyncio
+import os
+import pathlib
+import sys
+import tempfile
+
+import pytest
+
+root = pathlib.Path(__file__).resolve().parent.parent
+# The server and the updater import their own modules flat, the same as when they're run from their directories
+sys.path[:0] = [str(root), str(root / "server"), str(root / "data_updater")]
+
+# Everything runs against a throwaway SQLite file. The sync engine built from DB_TYPE is never connected to, the
+# updater's sessions are rebound to the same file in the `database` fixture.
+database_path = pathlib.Path(tempfile.mkdtemp()) / "test.db"
+os.environ.setdefault("DB_TYPE", "postgresql+psycopg2")
+os.environ.setdefault("DB_ASYNC_URL", f"sqlite+aiosqlite:///{database_path}")
+
+from sqlalchemy import create_engine  # noqa: E402
+
+import common.database as database  # noqa: E402
+import common.models  # noqa: E402,F401
+
+sync_engine = create_engine(f"sqlite:///{database_path}")
+database.session_factory.configure(bind=sync_engine)
+
+
+@pytest.fixture
+def database_session():
+    database.Base.metadata.create_all(sync_engine)
+    session = database.session_factory()
+    yield session
+    session.close()
+    # The server keeps pooled connections to the file, they have to let go of it before the tables are dropped
+    asyncio.run(database.async_engine.dispose())
+    database.Base.metadata.drop_all(sync_engine)
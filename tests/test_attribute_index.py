@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy import select
+
+import schema as schema_module
+from common.models import Attribute, Class, Course, TermAttributeBitmap, TermClassIndex, TermData, TermDataSource
+from data_updater import build_attribute_index
+from result_cache import result_cache
+from schema import schema
+
+term = "FALL_2024"
+updated = datetime.datetime(2024, 3, 1)
+
+
+def execute(query: str, **variables):
+    return asyncio.run(schema.execute(query, variable_values=variables, context_value={}))
+
+
+def add_class(database_session, course_code: str, class_number: int):
+    database_session.add(Class(course_id=course_code, class_section="001", class_number=class_number,
+                               title=course_code, term=term, units="3", instruction_type="In Person",
+                               enrollment_total=0, last_updated_at=updated, last_updated_from="pdf"))
+
+
+@pytest.fixture
+def attributed_classes(database_session):
+    database_session.add(TermData(name=term))
+    database_session.add(TermDataSource(source="pdf", raw_term_name="Fall 2024", term_name=term,
+                                        last_updated=updated, last_seen=updated))
+    quant = Attribute(label="Making Connections Gen Ed", value="FC-QUANT")
+    knowing = Attribute(label="Making Connections Gen Ed", value="FC-KNOWING")
+    attributes = {"COMP 110": [quant], "COMP 210": [quant, knowing], "ENGL 105": [knowing], "HIST 101": []}
+    for code, course_attributes in attributes.items():
+        database_session.add(Course(code=code, title=code, credits="3", last_updated_at=updated,
+                                    last_updated_from="catalog", attributes=course_attributes))
+    # Class numbers far apart, the bitmaps shouldn't grow with them
+    for number, code in enumerate(attributes):
+        add_class(database_session, code, 90000 + number * 1000)
+    database_session.commit()
+    build_attribute_index()
+    result_cache.entries.clear()
+    result_cache.versions.clear()
+    yield
+
+
+def attribute_query(attrs):
+    result = execute("""query($term: String!, $attrs: [String!]!) {
+        classes(term: $term, attrs: $attrs) { course { code } }
+    }""", term=term, attrs=attrs)
+    assert result.errors is None
+    return sorted(class_data["course"]["code"] for class_data in result.data["classes"])
+
+
+@pytest.mark.parametrize("max_matches", [500, 0])
+def test_attribute_filter(attributed_classes, monkeypatch, max_matches):
+    # 0 sends every filter through the join rather than the bitmaps
+    monkeypatch.setattr(schema_module, "max_search_matches", max_matches)
+    assert attribute_query(["FC-QUANT"]) == ["COMP 110", "COMP 210"]
+    assert attribute_query(["FC-QUANT", "FC-KNOWING"]) == ["COMP 210"]
+    assert attribute_query(["FC-NOTHING"]) == []
+
+
+def test_bitmaps_are_indexed_by_ordinal(attributed_classes, database_session):
+    assert TermClassIndex.decode(database_session.scalar(select(TermClassIndex.class_numbers))) == \
+        [90000, 91000, 92000, 93000]
+    assert all(len(bitmap) == 1 for bitmap in database_session.scalars(select(TermAttributeBitmap.bitmap)))
+
+
+def test_rebuild_only_moves_the_version_when_bitmaps_change(attributed_classes, database_session):
+    built_at = database_session.scalar(select(TermClassIndex.built_at))
+    build_attribute_index()
+    database_session.expire_all()
+    assert database_session.scalar(select(TermClassIndex.built_at)) == built_at
+
+    add_class(database_session, "COMP 110", 94000)
+    database_session.commit()
+    build_attribute_index()
+    database_session.expire_all()
+    assert database_session.scalar(select(TermClassIndex.built_at)) > built_at
+    assert attribute_query(["FC-QUANT"]) == ["COMP 110", "COMP 110", "COMP 210"]
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, inspect, text
+
+import common.database as database
+
+
+def test_upgrade_schema_brings_old_tables_up_to_date(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    # class_schedule as it was before days_mask
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE class_schedule (id INTEGER PRIMARY KEY, building VARCHAR(32), "
+                                "room VARCHAR(16), days VARCHAR(10), start_time INTEGER, end_time INTEGER, "
+                                "class_number INTEGER, term VARCHAR(20))"))
+        connection.execute(text("INSERT INTO class_schedule (id, days, class_number, term) VALUES (1, 'MWF', 1, 'X')"))
+        # class_enrollment_stamp before valid_through, with the index that repeated its primary key
+        connection.execute(text("CREATE TABLE class_enrollment_stamp (class_number INTEGER, term VARCHAR(32), "
+                                "enrollment_cap INTEGER, enrollment_total INTEGER, waitlist_cap INTEGER, "
+                                "waitlist_total INTEGER, min_enrollment INTEGER, timestamp DATETIME, source VARCHAR(7), "
+                                "PRIMARY KEY (class_number, term, timestamp, source))"))
+        connection.execute(text("CREATE INDEX ix_class_enrollment_stamp_term_class_time "
+                                "ON class_enrollment_stamp (term, class_number, timestamp)"))
+    monkeypatch.setattr(database, "engine", engine)
+
+    database.init_db()
+    # Running it against an up to date database changes nothing
+    database.init_db()
+
+    inspector = inspect(engine)
+    assert "days_mask" in {column["name"] for column in inspector.get_columns("class_schedule")}
+    assert "ix_class_schedule_class_days_time" in {index["name"] for index in inspector.get_indexes("class_schedule")}
+    assert "valid_through" in {column["name"] for column in inspector.get_columns("class_enrollment_stamp")}
+    assert inspector.get_indexes("class_enrollment_stamp") == []
+    # The trigram indexes are Postgres only
+    assert not any(index["name"].endswith("_trgm") for index in inspector.get_indexes("class"))
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT days FROM class_schedule")).scalar() == "MWF"
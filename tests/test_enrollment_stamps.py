@@ -0,0 +1,38 @@
+import datetime
+
+from sqlalchemy import select
+
+from common.models import ClassEnrollmentStamp
+from enrollment_stamps import EnrollmentStampWriter, extend_unchanged_stamps
+
+term = "FALL_2024"
+first_run = datetime.datetime(2024, 3, 1)
+second_run = datetime.datetime(2024, 3, 2)
+
+
+def valid_through(database_session):
+    return dict(database_session.execute(select(ClassEnrollmentStamp.class_number,
+                                                ClassEnrollmentStamp.valid_through)).all())
+
+
+def test_unchanged_runs_extend_the_last_runs_stamps(database_session):
+    stamps = EnrollmentStampWriter(database_session, "search", [term])
+    stamps.record(1000, term, first_run, enrollment_total=-5)
+    stamps.record(1001, term, first_run, enrollment_total=-3)
+    stamps.flush()
+    database_session.commit()
+    # 1001 is no longer listed by the second run
+    stamps = EnrollmentStampWriter(database_session, "search", [term])
+    stamps.record(1000, term, second_run, enrollment_total=-5)
+    stamps.flush()
+    database_session.commit()
+    assert valid_through(database_session) == {1000: second_run, 1001: first_run}
+
+    # A third run whose results didn't change at all only moves on what the second run saw
+    third_run = datetime.datetime(2024, 3, 3)
+    extend_unchanged_stamps(database_session, "search", [term], third_run)
+    # Other sources and runs that aren't newer are left alone
+    extend_unchanged_stamps(database_session, "pdf", [term], third_run)
+    extend_unchanged_stamps(database_session, "search", [term], second_run)
+    database_session.commit()
+    assert valid_through(database_session) == {1000: third_run, 1001: first_run}
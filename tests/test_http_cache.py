@@ -0,0 +1,69 @@
+import hashlib
+import io
+import os
+
+import pytest
+import requests
+
+from http_cache import HTTPCache
+
+
+def fake_get(status_code: int, content: bytes):
+    def get(url, **kwargs):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = content
+        response.url = url
+        return response
+    return get
+
+
+def test_error_responses_leave_the_cache_alone(tmp_path):
+    cache = HTTPCache(str(tmp_path))
+    url = "https://catalog.unc.edu/courses/comp/"
+    assert cache.fetch(fake_get(200, b"courses"), url).content == b"courses"
+    with pytest.raises(requests.HTTPError):
+        cache.fetch(fake_get(503, b"unavailable"), url)
+    page = cache.fetch(fake_get(304, b""), url)
+    assert page.content == b"courses"
+
+
+# Streams `content` the way requests does for a large download, in chunks as read from the connection
+def streaming_get(content: bytes, chunks: list):
+    def get(url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(content)
+        response.url = url
+        iter_content = response.iter_content
+
+        def recorded_iter_content(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                chunks.append(chunk)
+                yield chunk
+        response.iter_content = recorded_iter_content
+        return response
+    return get
+
+
+def test_download_hashes_the_whole_stream(tmp_path):
+    cache = HTTPCache(str(tmp_path / "cache"))
+    url = "https://registrar.unc.edu/ssb.pdf"
+    destination, reference = str(tmp_path / "download.pdf"), str(tmp_path / "ssb.pdf")
+    # Just over the download's chunk size, so it arrives in two chunks
+    content = b"%PDF-1.4" + bytes(range(256)) * 4096
+    chunks = []
+    download = cache.download(streaming_get(content, chunks), url, destination, reference)
+    assert len(chunks) == 2
+    assert download.sha256 == hashlib.sha256(content).hexdigest()
+    with open(destination, "rb") as destination_file:
+        assert destination_file.read() == content
+    assert download.changed
+
+    # Once processed, the same file again is unchanged, but a change in the last chunk alone is noticed
+    os.replace(destination, reference)
+    cache.mark_processed(download.key)
+    assert not cache.download(streaming_get(content, []), url, destination, reference).changed
+    changed_content = content[:-1] + b"!"
+    changed = cache.download(streaming_get(changed_content, []), url, destination, reference)
+    assert changed.changed and changed.sha256 == hashlib.sha256(changed_content).hexdigest()
@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+import requests
+
+import data_updater
+import http_client
+from http_cache import HTTPCache
+from http_client import RateLimitedFetcher, TokenBucket
+
+
+# Stands in for the time module, sleeping only moves the clock on
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_client, "time", clock)
+    return clock
+
+
+def response(status_code: int, url: str = "https://catalog.unc.edu/courses/comp/"):
+    page = requests.Response()
+    page.status_code = status_code
+    page._content = b"courses"
+    page.url = url
+    return page
+
+
+def test_bucket_allows_a_burst_then_holds_to_the_rate(clock):
+    bucket = TokenBucket(rate=4, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    # Once the burst is spent every request waits for the next token
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.sleeps == [0.25] * 4
+    assert clock.now == 101.0
+
+    # Idle time refills the bucket, but never past its capacity
+    clock.now += 10
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == [0.25] * 5
+
+
+def test_get_retries_through_the_bucket_with_backoff(clock, monkeypatch):
+    fetcher = RateLimitedFetcher(workers=1, rate=1, retries=3, backoff=1)
+    statuses = [503, 429, 200]
+    monkeypatch.setattr(fetcher.session, "get", lambda url, **kwargs: response(statuses.pop(0), url))
+    assert fetcher.get("https://catalog.unc.edu/courses/comp/").status_code == 200
+    # Backing off twice, which is long enough that the retries find a token waiting in the bucket
+    assert clock.sleeps == [1, 2]
+    fetcher.close()
+
+
+def test_get_gives_up_after_its_retries(clock, monkeypatch):
+    fetcher = RateLimitedFetcher(workers=1, rate=1, retries=2, backoff=1)
+    attempts = []
+
+    def get(url, **kwargs):
+        attempts.append(url)
+        if len(attempts) == 1:
+            raise requests.ConnectionError("Connection reset")
+        return response(503, url)
+
+    monkeypatch.setattr(fetcher.session, "get", get)
+    with pytest.raises(requests.HTTPError):
+        fetcher.get("https://catalog.unc.edu/courses/comp/")
+    assert len(attempts) == 3
+    fetcher.close()
+
+
+def test_fetch_all_runs_up_to_workers_at_once():
+    fetcher = RateLimitedFetcher(workers=3, rate=1000)
+    # Every fetch waits for two others, so this only finishes if three of them run at the same time
+    barrier = threading.Barrier(3, timeout=5)
+    lock = threading.Lock()
+    running = []
+    most_running = []
+
+    def fetch(url):
+        with lock:
+            running.append(url)
+            most_running.append(len(running))
+        barrier.wait()
+        with lock:
+            running.remove(url)
+        if url.endswith("/bad/"):
+            raise requests.ConnectionError("Connection reset")
+        return url
+
+    urls = {str(number): f"https://catalog.unc.edu/courses/{'bad' if number == 4 else number}/" for number in range(6)}
+    results = dict(fetcher.fetch_all(urls, fetch))
+    assert max(most_running) == 3
+    # A page that couldn't be fetched comes back as its exception rather than ending the rest
+    assert isinstance(results.pop("4"), requests.ConnectionError)
+    assert results == {key: url for key, url in urls.items() if key != "4"}
+    fetcher.close()
+
+
+def test_catalog_closes_the_fetcher_when_it_gives_up(database_session, tmp_path, monkeypatch):
+    fetchers = []
+
+    class UnreachableFetcher(RateLimitedFetcher):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.closed = False
+            fetchers.append(self)
+
+        def get(self, url, **kwargs):
+            raise requests.ConnectionError("Connection refused")
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    monkeypatch.setattr(data_updater, "RateLimitedFetcher", UnreachableFetcher)
+    monkeypatch.setattr(data_updater, "http_cache", HTTPCache(str(tmp_path)))
+    monkeypatch.setattr(data_updater, "subjects", ("AAAD", "AERO", "AMST", "ANTH", "APPL", "ARAB", "ARCH"))
+    built = []
+    monkeypatch.setattr(data_updater, "build_attribute_index", lambda: built.append(True))
+    # Five subjects failing is an early return, which still has to release the fetcher
+    data_updater.process_course_catalog()
+    assert [fetcher.closed for fetcher in fetchers] == [True]
+    assert built == []
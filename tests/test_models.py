@@ -0,0 +1,26 @@
+import pytest
+
+from common.models import days_to_mask, day_bits
+
+
+@pytest.mark.parametrize("days, expected", [
+    # The class search's spelling
+    ("MWF", ["M", "W", "F"]),
+    ("TuTh", ["Tu", "Th"]),
+    ("MTuWThF", ["M", "Tu", "W", "Th", "F"]),
+    ("SaSu", ["Sa", "Su"]),
+    # The SSB pdf's spelling
+    ("TTH", ["Tu", "Th"]),
+    ("TH", ["Th"]),
+    ("T", ["Tu"]),
+    ("MTWTHF", ["M", "Tu", "W", "Th", "F"]),
+    ("S", ["Sa"]),
+    ("SU", ["Su"]),
+    ("SSU", ["Sa", "Su"]),
+    # No days at all
+    ("TBA", []),
+    ("", []),
+    (None, []),
+])
+def test_days_to_mask(days, expected):
+    assert days_to_mask(days) == sum(day_bits[day] for day in expected)
@@ -0,0 +1,114 @@
+import dataclasses
+import datetime
+import glob
+import gzip
+import json
+import pathlib
+import random
+
+import pytest
+
+from data_updater import PDFParser
+
+# How fast PDFParser's state machine gets through SSB text, without a database or any pdf extraction, over a
+# synthetic report in the SSB's fixed column layout and every recorded corpus: the report in tests/data and the text
+# sidecars of whichever pdfs have been parsed on this machine. Run with `pytest tests/test_parse_benchmark.py`, and
+# `--benchmark-compare` against a saved run to catch regressions.
+
+data = pathlib.Path(__file__).parent / "data"
+recorded_report = data / "ssb_report.txt"
+# What the parser made of recorded_report before parse_line was split into line_handlers
+recorded_records = data / "ssb_report.records.json"
+sidecars = sorted(glob.glob(str(pathlib.Path(__file__).parent.parent / "data_updater" / "ssb-collection" /
+                                "*.text.json.gz")))
+source_datetime = datetime.datetime(2024, 3, 1, 6, 30)
+
+split_line = PDFParser.pdf_split_line
+
+
+def synthetic_first_line(subject, number, section, class_number, title, component, units):
+    return "  " + subject.ljust(10) + number.ljust(11) + section.ljust(9) + str(class_number).ljust(12) + \
+        title.ljust(29) + component.ljust(29) + units.ljust(12) + "".ljust(29)
+
+
+# A report with `classes` classes covering every state of the parser: notes, several schedules and instructors,
+# properties and reserve capacities, plus the page headers between them
+def synthetic_lines(classes: int, seed: int = 0):
+    generator = random.Random(seed)
+    lines = ["Report ID: SSB", split_line]
+    for i in range(classes):
+        lines.append(synthetic_first_line(generator.choice(["COMP", "MATH", "ENGL", "BIOL"]), str(100 + i % 700),
+                                          f"{i % 5 + 1:03d}", 10000 + i, f"Course Title {i}",
+                                          generator.choice(["Lecture", "Recitation", "Lab"]), "3"))
+        lines.append(" " * 89 + generator.choice(["In Person", "Remote Only", "Hybrid"]))
+        if i % 7 == 0:
+            lines += ["      Department consent required.", ""]
+        for schedule in range(1 + (i % 5 == 0)):
+            lines.append(f"    Bldg: Sitterson Hall     Room: {100 + schedule:04d}     Days: "
+                         f"{generator.choice(['MWF', 'TTH', 'TBA'])}     Time: "
+                         f"{generator.choice(['09:05 - 09:55', '14:00 - 15:15', 'TBA'])}")
+            for instructor in range(1 + (i % 3 == 0)):
+                lines.append(f"   {'PI' if instructor == 0 else 'SI'}   1.00   Instructor:Instructor,Name {i}")
+        lines.append(f"   Class Enrl Cap:{generator.randint(10, 300)}   Class Enrl Tot:{generator.randint(0, 300)}"
+                     f"   Class Wait Cap:{generator.randint(0, 20)}   Class Wait Tot:0   Class Min Enrl:0")
+        lines.append(generator.choice(["GR1", "GR3", "CPF"]))
+        lines.append("Combined Section ID: X" + str(i % 50))
+        if i % 4 == 0:
+            lines.append("Class Equivalents: E" + str(i % 30))
+        if i % 6 == 0:
+            lines.append(("                Reserve Capacity:".ljust(34) + "01-JAN-2025  " + "Majors only".ljust(48) +
+                          "10".rjust(3) + " " + "3").ljust(131))
+        lines += ["", split_line]
+        if i % 40 == 39:
+            lines += ["Report ID: SSB", split_line]
+    return lines
+
+
+def recorded_lines(path: str):
+    if path.endswith(".json.gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as sidecar_file:
+            pages = json.load(sidecar_file)["pages"]
+    else:
+        with open(path, encoding="utf-8") as text_file:
+            pages = [text_file.read()]
+    return [line for page in pages for line in page.split("\n")]
+
+
+# Runs the lines through a fresh parser the same way PDFParser.parse_pages does, minus the progress bars and state
+# log. Returns the parser and the classes it finished.
+def parse(lines):
+    parser = PDFParser("BENCHMARK", "benchmark")
+    parser.source_datetime = source_datetime
+    records = []
+    for line in lines:
+        try:
+            record = parser.parse_line(line)
+        except Exception:
+            parser.errors += 1
+            parser.reset_state()
+            continue
+        if record is not None:
+            records.append(record)
+    return parser, records
+
+
+def test_parse_synthetic(benchmark):
+    lines = synthetic_lines(2000)
+    parser, records = benchmark(parse, lines)
+    assert len(records) == 2000 and parser.errors == 0
+
+
+@pytest.mark.parametrize("path", [str(recorded_report)] + sidecars, ids=lambda path: pathlib.Path(path).name)
+def test_parse_recorded(benchmark, path):
+    lines = recorded_lines(path)
+    parser, records = benchmark(parse, lines)
+    assert len(records) > 0 and parser.errors < 5
+
+
+def test_handler_table_matches_recorded_output():
+    parser, records = parse(recorded_lines(str(recorded_report)))
+    with open(recorded_records, encoding="utf-8") as records_file:
+        expected = json.load(records_file)
+    assert parser.errors == expected["errors"]
+    assert [json.loads(json.dumps(dataclasses.asdict(record), default=str)) for record in records] == \
+        expected["records"]
@@ -0,0 +1,337 @@
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+
+import pytest
+import requests
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+from common.models import Class, ClassEnrollmentStamp, ClassSchedule, ClassReserveCapacity, Course, Instructor, \
+    TermData, TermDataSource, days_to_mask, schedule_instructor_join_table
+import data_updater
+from data_updater import PDFParser
+from enrollment_stamps import EnrollmentStampWriter
+from http_cache import HTTPCache
+
+term = "FALL_2024"
+source_datetime = datetime.datetime(2024, 3, 1, 6, 30)
+recorded_report = pathlib.Path(__file__).parent / "data" / "ssb_report.txt"
+# The recorded report has 78 classes, so it's written in 8 chunks
+chunk_size = 10
+
+
+@pytest.fixture
+def page_texts():
+    with open(recorded_report, encoding="utf-8") as report_file:
+        text = report_file.read()
+    # Split in two so chunks and checkpoints land on both pages
+    lines = text.split("\n")
+    middle = lines.index(PDFParser.pdf_split_line, len(lines) // 2) + 1
+    return ["\n".join(lines[:middle]), "\n".join(lines[middle:])]
+
+
+# A parser set up the way PDFParser.parse leaves it right before the pages are parsed, checkpointing to tmp_path
+def make_parser(tmp_path):
+    parser = PDFParser(term, "https://example.com/ssb.pdf", chunk_size=chunk_size)
+    parser.source_datetime = source_datetime
+    parser.digest = "0" * 64
+    parser.checkpoint_path = str(tmp_path / (term + ".checkpoint.json"))
+    parser.load_stored()
+    parser.db_session.commit()
+    return parser
+
+
+# Parses the pages from wherever the checkpoint says, returning what write_records did
+def run(parser, page_texts):
+    start_page, start_line = parser.load_checkpoint()
+    try:
+        return parser.write_records(parser.parse_pages(page_texts[start_page:], start_page, start_line))
+    finally:
+        parser.db_session.remove()
+
+
+# Everything the parser wrote, in a form that can be compared between runs
+def stored(database_session):
+    database_session.expire_all()
+    classes = database_session.scalars(select(Class).order_by(Class.class_number).options(
+        selectinload(Class.schedules).selectinload(ClassSchedule.instructors),
+        selectinload(Class.reserve_capacities))).all()
+    return {
+        "classes": [(class_obj.class_number, class_obj.course_id, class_obj.enrollment_total,
+                     sorted((schedule.building, schedule.room, schedule.days, schedule.start_time,
+                             sorted(instructor.name for instructor in schedule.instructors))
+                            for schedule in class_obj.schedules),
+                     sorted((reserve.description, reserve.enroll_cap) for reserve in class_obj.reserve_capacities))
+                    for class_obj in classes],
+        "rows": {model.__tablename__: database_session.scalar(select(func.count()).select_from(model))
+                 for model in (Class, ClassSchedule, ClassReserveCapacity, Course, Instructor, ClassEnrollmentStamp)},
+    }
+
+
+# Lets `chunks` chunks through and makes every chunk after them fail, the way a crash or lost connection would
+def stop_after(monkeypatch, chunks):
+    write_chunk = PDFParser.write_chunk
+    written = []
+
+    def failing_write_chunk(self, chunk):
+        if len(written) >= chunks:
+            raise RuntimeError("Connection lost")
+        write_chunk(self, chunk)
+        written.append(chunk)
+
+    monkeypatch.setattr(PDFParser, "write_chunk", failing_write_chunk)
+    return written
+
+
+def test_stopped_parse_keeps_the_chunks_it_committed(database_session, tmp_path, monkeypatch, page_texts):
+    written = stop_after(monkeypatch, 3)
+    parser = make_parser(tmp_path)
+    assert not run(parser, page_texts)
+    assert parser.write_failed
+
+    # Exactly the classes of the committed chunks are stored, and the checkpoint points right past the last of them
+    committed = [record.values["class_number"] for chunk in written for record in chunk.records]
+    assert len(committed) == 3 * chunk_size
+    assert [row[0] for row in stored(database_session)["classes"]] == sorted(committed)
+    with open(parser.checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    page, line = written[-1].position
+    assert (checkpoint["page"], checkpoint["line"], checkpoint["state"]) == (page, line + 1, "first_line")
+
+
+def test_resumed_parse_stores_the_same_rows_as_an_uninterrupted_one(database_session, tmp_path, monkeypatch,
+                                                                     page_texts):
+    parser = make_parser(tmp_path)
+    assert run(parser, page_texts)
+    # parse removes the checkpoint once the whole file is written
+    os.remove(parser.checkpoint_path)
+    uninterrupted = stored(database_session)
+    database_session.close()
+    bind = database_session.get_bind()
+    Class.metadata.drop_all(bind)
+    Class.metadata.create_all(bind)
+
+    with monkeypatch.context() as stopped:
+        stop_after(stopped, 3)
+        assert not run(make_parser(tmp_path), page_texts)
+    parser = make_parser(tmp_path)
+    assert parser.load_checkpoint() != (0, 0)
+    assert run(parser, page_texts)
+    # Nothing from the chunks committed before the stop was parsed or written again
+    assert stored(database_session) == uninterrupted
+
+
+def pdf_response(url, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"%PDF-1.4 recorded report"
+    response._content_consumed = True
+    response.url = url
+    return response
+
+
+class FakeReader:
+    def __init__(self, path):
+        self.pages = [self, self]
+
+    def extract_text(self, **kwargs):
+        return "Report ID: SSB   Run Date:  03/01/2024   Run Time:  06:30:00"
+
+
+@pytest.fixture
+def forced_parse(database_session, tmp_path, monkeypatch, page_texts):
+    # parse works relative to the working directory and downloads through the module's cache and requests.get
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(data_updater, "http_cache", HTTPCache(str(tmp_path / "http-cache")))
+    monkeypatch.setattr(data_updater.requests, "get", pdf_response)
+    monkeypatch.setattr(data_updater, "PdfReader", FakeReader)
+    monkeypatch.setattr(data_updater, "cached_page_texts",
+                        lambda path, workers, digest, reader, start_page: (page for page in page_texts[start_page:]))
+    database_session.add(TermData(name=term, sources=[
+        TermDataSource(source="pdf", raw_term_name="Fall 2024", last_updated=source_datetime,
+                       last_seen=source_datetime)]))
+    database_session.commit()
+
+    # A previous attempt at the same file stopped after a few chunks
+    parser = make_parser(tmp_path)
+    parser.checkpoint_path = str(tmp_path / "ssb-collection" / (term + ".checkpoint.json"))
+    parser.digest = hashlib.sha256(pdf_response("").content).hexdigest()
+    os.mkdir(tmp_path / "ssb-collection")
+    with monkeypatch.context() as stopped:
+        stop_after(stopped, 3)
+        assert not run(parser, page_texts)
+    assert os.path.exists(parser.checkpoint_path)
+    return parser.checkpoint_path
+
+
+def test_forced_parse_throws_the_checkpoint_away(database_session, forced_parse, monkeypatch):
+    # Even when the forced parse fails right away, there's no checkpoint left for the next run to resume from
+    stop_after(monkeypatch, 0)
+    assert PDFParser(term, "https://example.com/ssb.pdf", chunk_size=chunk_size).parse(force=True) == "failed"
+    assert not os.path.exists(forced_parse)
+
+
+def test_forced_parse_starts_from_the_first_page(database_session, forced_parse, monkeypatch):
+    written = stop_after(monkeypatch, 100)
+    assert PDFParser(term, "https://example.com/ssb.pdf", chunk_size=chunk_size).parse(force=True) == "parsed"
+    assert written[0].records[0].position[0] == 0
+    assert sum(len(chunk.records) for chunk in written) == 78
+    assert not os.path.exists(forced_parse)
+
+
+def test_writer_failing_mid_chunk_rolls_it_back_and_stops_the_parse(database_session, tmp_path, monkeypatch,
+                                                                     page_texts):
+    flush = EnrollmentStampWriter.flush
+    flushes = []
+
+    # The third chunk fails after its classes were added to the session but before they're committed
+    def failing_flush(self):
+        flushes.append(self)
+        if len(flushes) == 3:
+            raise RuntimeError("Connection lost")
+        flush(self)
+
+    monkeypatch.setattr(EnrollmentStampWriter, "flush", failing_flush)
+    parser = make_parser(tmp_path)
+    parsed = []
+
+    def records():
+        for record in parser.parse_pages(page_texts):
+            parsed.append(record)
+            yield record
+
+    assert not parser.write_records(records())
+    parser.db_session.remove()
+    assert parser.write_failed and not parser.aborted
+
+    # Only the two chunks before it are stored, and the checkpoint still points past the second one
+    assert len(stored(database_session)["classes"]) == 2 * chunk_size
+    assert database_session.scalar(select(func.count()).select_from(ClassEnrollmentStamp)) == 2 * chunk_size
+    with open(parser.checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    page, line = parsed[2 * chunk_size - 1].position
+    assert (checkpoint["page"], checkpoint["line"]) == (page, line + 1)
+    # Parsing stopped once the writer failed rather than running through the rest of the file
+    assert len(flushes) == 3 and len(parsed) < 78
+
+
+first_parse = datetime.datetime(2024, 3, 1)
+second_parse = datetime.datetime(2024, 3, 2)
+
+
+# A class the way build_class makes one, schedules are (room, days, start_time, instructors) and the reserve
+# capacity is (description, enroll_cap)
+def make_class(schedules, reserve=None, enrollment_total=10, updated=first_parse):
+    return Class(class_number=1000, term=term, course_id="COMP 110", class_section="001", title="Intro",
+                 component="Lecture", units="3", instruction_type="In Person", enrollment_cap=100,
+                 enrollment_total=enrollment_total, last_updated_at=updated, last_updated_from="pdf",
+                 schedules=[ClassSchedule(building="Sitterson Hall", room=room, days=days, days_mask=days_to_mask(days),
+                                          start_time=start_time, end_time=start_time + 50, instructors=instructors)
+                            for room, days, start_time, instructors in schedules],
+                 reserve_capacities=[ClassReserveCapacity(expire_date=first_parse, description=reserve[0],
+                                                          enroll_cap=reserve[1], enroll_total=0)]
+                 if reserve is not None else [])
+
+
+@pytest.fixture
+def merge(database_session):
+    parser = PDFParser(term, "https://example.com/ssb.pdf")
+    session = parser.db_session
+    smith, jones = Instructor(name="Smith,John", instructor_type="PI"), Instructor(name="Jones,Ann", instructor_type="PI")
+    session.add(make_class([("0014", "MWF", 545, [smith]), ("0011", "TTH", 600, [jones])], ("Majors only", 10)))
+    session.commit()
+
+    def load():
+        return session.scalars(select(Class).options(
+            selectinload(Class.schedules).selectinload(ClassSchedule.instructors),
+            selectinload(Class.reserve_capacities))).one()
+
+    # Merges the parsed class into the stored one and commits, then lets go of everything but the instructors the
+    # same as write_chunk. Returns whether anything changed and the stored class as read back.
+    def merge(schedules, reserve=None, enrollment_total=10):
+        changed = parser.merge_class(load(), make_class(schedules, reserve, enrollment_total, second_parse))
+        session.commit()
+        for instance in list(session.identity_map.values()):
+            if not isinstance(instance, Instructor):
+                session.expunge(instance)
+        return changed, load()
+
+    yield merge, load, smith, jones
+    parser.db_session.remove()
+
+
+def schedule_rows(class_obj):
+    return sorted((schedule.room, schedule.days, schedule.start_time,
+                   sorted(instructor.name for instructor in schedule.instructors)) for schedule in class_obj.schedules)
+
+
+def test_merging_an_unchanged_class_writes_nothing(merge):
+    merge, load, smith, jones = merge
+    schedule_ids = {schedule.room: schedule.id for schedule in load().schedules}
+    # The parsed schedules come in a different order than they were stored in
+    changed, stored_class = merge([("0011", "TTH", 600, [jones]), ("0014", "MWF", 545, [smith])], ("Majors only", 10))
+    assert not changed
+    assert stored_class.last_updated_at == first_parse
+    assert {schedule.room: schedule.id for schedule in stored_class.schedules} == schedule_ids
+
+
+def test_merging_updates_changed_rows_in_place(merge):
+    merge, load, smith, jones = merge
+    schedule_ids = sorted(schedule.id for schedule in load().schedules)
+    changed, stored_class = merge([("0014", "MWF", 545, [smith]), ("0011", "TTH", 660, [jones])],
+                                  ("Juniors only", 20), enrollment_total=12)
+    assert changed
+    assert (stored_class.enrollment_total, stored_class.last_updated_at) == (12, second_parse)
+    assert schedule_rows(stored_class) == [("0011", "TTH", 660, ["Jones,Ann"]), ("0014", "MWF", 545, ["Smith,John"])]
+    # The changed schedule kept its row rather than being deleted and recreated
+    assert sorted(schedule.id for schedule in stored_class.schedules) == schedule_ids
+    assert [(reserve.description, reserve.enroll_cap) for reserve in stored_class.reserve_capacities] == \
+        [("Juniors only", 20)]
+
+
+def test_merging_adds_and_removes_rows(merge, database_session):
+    merge, load, smith, jones = merge
+    changed, stored_class = merge([("0014", "MWF", 545, [smith])])
+    assert changed
+    assert schedule_rows(stored_class) == [("0014", "MWF", 545, ["Smith,John"])]
+    assert stored_class.reserve_capacities == []
+    # The removed schedule's instructors went with it
+    assert database_session.scalar(select(func.count()).select_from(ClassSchedule)) == 1
+    assert database_session.scalar(select(func.count()).select_from(ClassReserveCapacity)) == 0
+    assert database_session.scalar(select(func.count()).select_from(schedule_instructor_join_table)) == 1
+
+    changed, stored_class = merge([("0014", "MWF", 545, [smith]), ("0011", "TTH", 600, [jones])], ("Majors only", 10))
+    assert changed
+    assert schedule_rows(stored_class) == [("0011", "TTH", 600, ["Jones,Ann"]), ("0014", "MWF", 545, ["Smith,John"])]
+    assert [(reserve.description, reserve.enroll_cap) for reserve in stored_class.reserve_capacities] == \
+        [("Majors only", 10)]
+
+
+def test_merging_replaces_changed_instructors(merge):
+    merge, load, smith, jones = merge
+    changed, stored_class = merge([("0014", "MWF", 545, [smith, jones]), ("0011", "TTH", 600, [])],
+                                  ("Majors only", 10))
+    assert changed
+    assert stored_class.last_updated_at == second_parse
+    assert schedule_rows(stored_class) == [("0011", "TTH", 600, []), ("0014", "MWF", 545, ["Jones,Ann", "Smith,John"])]
+
+    changed, stored_class = merge([("0014", "MWF", 545, [jones, smith]), ("0011", "TTH", 600, [])],
+                                  ("Majors only", 10))
+    assert not changed
+
+
+def test_merge_rows_pairs_identical_rows_before_updating_leftovers():
+    columns = ("room", "days")
+    stored_rows = [ClassSchedule(room="0011", days="TTH"), ClassSchedule(room="0014", days="MWF"),
+                   ClassSchedule(room="0020", days="F")]
+    parsed_rows = [ClassSchedule(room="0014", days="MWF"), ClassSchedule(room="0030", days="MW")]
+    pairs, removed, added, changed = PDFParser(term, "https://example.com/ssb.pdf").merge_rows(
+        stored_rows, parsed_rows, columns)
+    assert changed and added == []
+    assert pairs == [(stored_rows[1], parsed_rows[0]), (stored_rows[0], parsed_rows[1])]
+    # The first leftover stored row took the new values, the other one is left to be deleted
+    assert (stored_rows[0].room, stored_rows[0].days) == ("0030", "MW")
+    assert removed == [stored_rows[2]]
@@ -0,0 +1,20 @@
+from contextlib import closing
+from os.path import exists
+
+from pdf_text import load_sidecar, sidecar_path, write_sidecar
+
+pages = ["Report ID: SSB\n  COMP 110", 'quotes " and \\ backslashes', ""]
+
+
+def test_sidecar_is_written_as_pages_pass_through(tmp_path):
+    path = str(tmp_path / "report.pdf")
+    assert list(write_sidecar(path, "digest", iter(pages))) == pages
+    assert load_sidecar(path, "digest") == pages
+    assert load_sidecar(path, "other digest") is None
+
+
+def test_stopping_early_keeps_the_old_sidecar(tmp_path):
+    path = str(tmp_path / "report.pdf")
+    with closing(write_sidecar(path, "digest", iter(pages))) as sidecar_pages:
+        next(sidecar_pages)
+    assert not exists(sidecar_path(path)) and not exists(sidecar_path(path) + ".tmp")
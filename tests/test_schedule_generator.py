@@ -0,0 +1,61 @@
+import itertools
+import random
+
+import pytest
+
+import schedule_generator
+from schedule_generator import Section, group_sections, generate, rank, schedule_occupancy
+
+
+def section(class_number: int, days_mask: int, start_time: int, end_time: int) -> Section:
+    return Section(class_number=class_number, occupancy=schedule_occupancy(days_mask, start_time, end_time))
+
+
+def random_groups(generator: random.Random, courses: int, sections: int):
+    groups = []
+    for course in range(courses):
+        groups.append([section(course * 100 + number, generator.choice([0b10101, 0b01010, 0b00001, 0b11111]),
+                               start, start + 50)
+                       for number, start in enumerate(generator.sample(range(8 * 60, 17 * 60, 30), sections))])
+    return groups
+
+
+# Every conflict free schedule ranked, the generator has to agree with this on the best ones
+def brute_force(groups, limit):
+    schedules = []
+    for chosen in itertools.product(*groups):
+        occupied = 0
+        for chosen_section in chosen:
+            if chosen_section.occupancy & occupied:
+                break
+            occupied |= chosen_section.occupancy
+        else:
+            schedules.append(rank(occupied).key())
+    return sorted(schedules)[:limit]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_generate_finds_the_best_schedules(seed):
+    groups = random_groups(random.Random(seed), courses=4, sections=6)
+    generated = generate(groups, 5)
+    assert [schedule_rank.key() for schedule_rank, _ in generated] == brute_force(groups, 5)
+    for _, sections in generated:
+        # One section of every group, none of them overlapping
+        assert len(sections) == len(groups)
+        occupied = 0
+        for chosen_section in sections:
+            assert chosen_section.occupancy & occupied == 0
+            occupied |= chosen_section.occupancy
+
+
+def test_generate_stops_at_max_candidates(monkeypatch):
+    monkeypatch.setattr(schedule_generator, "max_candidates", 3)
+    groups = [[section(number, 1 << number % 5, 600, 650) for number in range(10)]]
+    assert len(generate(groups, 10)) == 3
+
+
+def test_pinned_classes_outside_the_requested_courses_are_an_error():
+    sections = [(("COMP 110", "Lecture"), section(1, 1, 600, 650)), (("COMP 110", "Lecture"), section(2, 2, 600, 650))]
+    assert [[chosen.class_number for chosen in group] for group in group_sections(sections, [2])] == [[2]]
+    with pytest.raises(ValueError):
+        group_sections(sections, [2, 3])
@@ -0,0 +1,223 @@
+import asyncio
+import dataclasses
+import datetime
+
+import pytest
+
+from common.database import Base
+from common.models import Class, ClassEnrollmentStamp, ClassSchedule, Course, CourseAttribute, TermData, TermDataSource, days_to_mask
+from result_cache import result_cache
+import schema as schema_module
+from schema import schema
+
+term = "FALL_2024"
+updated = datetime.datetime(2024, 3, 1)
+
+
+def execute(query: str, **variables):
+    # The router hands every request a fresh context dict, which SQLAlchemySession fills in
+    return asyncio.run(schema.execute(query, variable_values=variables, context_value={}))
+
+
+@pytest.fixture
+def classes(database_session):
+    database_session.add(TermData(name=term))
+    database_session.add(TermDataSource(source="pdf", raw_term_name="Fall 2024", term_name=term,
+                                        last_updated=updated, last_seen=updated))
+    for number in range(3):
+        code = f"COMP {110 + number}"
+        database_session.add(Course(code=code, title=f"Course {number}", credits="3", last_updated_at=updated,
+                                    last_updated_from="catalog",
+                                    attrs=[CourseAttribute(label="Making Connections Gen Ed", value="FC-QUANT")]))
+        database_session.add(Class(course_id=code, class_section="001", class_number=1000 + number,
+                                   title=f"Course {number}", term=term, units="3", instruction_type="In Person",
+                                   enrollment_total=10, last_updated_at=updated, last_updated_from="pdf",
+                                   schedules=[ClassSchedule(building="Sitterson", room="014", days="MWF",
+                                                            days_mask=days_to_mask("MWF"), start_time=9 * 60,
+                                                            end_time=9 * 60 + 50)]))
+    database_session.commit()
+    result_cache.entries.clear()
+    result_cache.versions.clear()
+    yield
+
+
+def test_course_selection_with_only_relationships(classes):
+    result = execute("""query($term: String!) {
+        classes(term: $term) { classNumber course { attrs { label value } } }
+    }""", term=term)
+    assert result.errors is None
+    assert [class_data["course"]["attrs"] for class_data in result.data["classes"]] == \
+        [[{"label": "Making Connections Gen Ed", "value": "FC-QUANT"}]] * 3
+
+
+def test_broad_search_falls_back_to_like(classes, monkeypatch):
+    monkeypatch.setattr(schema_module, "max_search_matches", 2)
+    query = """query($term: String!, $courseId: String!) {
+        classes(term: $term, courseId: $courseId) { classNumber }
+    }"""
+    broad = execute(query, term=term, courseId="c")
+    narrow = execute(query, term=term, courseId="111")
+    assert broad.errors is None and narrow.errors is None
+    assert sorted(class_data["classNumber"] for class_data in broad.data["classes"]) == [1000, 1001, 1002]
+    assert [class_data["classNumber"] for class_data in narrow.data["classes"]] == [1001]
+
+
+def test_days_filter_only_rules_out_weekdays(classes, database_session):
+    database_session.add(Class(course_id="COMP 110", class_section="002", class_number=1003, title="Course 0",
+                               term=term, units="3", instruction_type="In Person", enrollment_total=0,
+                               last_updated_at=updated, last_updated_from="pdf",
+                               schedules=[ClassSchedule(days="MSa", days_mask=days_to_mask("MSa"), start_time=600,
+                                                        end_time=650)]))
+    database_session.add(Class(course_id="COMP 110", class_section="003", class_number=1004, title="Course 0",
+                               term=term, units="3", instruction_type="In Person", enrollment_total=0,
+                               last_updated_at=updated, last_updated_from="pdf",
+                               schedules=[ClassSchedule(days="TuTh", days_mask=days_to_mask("TuTh"), start_time=600,
+                                                        end_time=650)]))
+    database_session.commit()
+    result = execute("""query($term: String!, $days: [String!]!) {
+        classes(term: $term, days: $days) { classNumber }
+    }""", term=term, days=["M", "W", "F"])
+    assert result.errors is None
+    assert sorted(class_data["classNumber"] for class_data in result.data["classes"]) == [1000, 1001, 1002, 1003]
+
+
+def holds_instance(value) -> bool:
+    if isinstance(value, Base):
+        return True
+    if isinstance(value, list):
+        return any(holds_instance(item) for item in value)
+    if dataclasses.is_dataclass(value):
+        return any(holds_instance(getattr(value, field.name)) for field in dataclasses.fields(value))
+    return False
+
+
+def test_cached_classes_outlive_their_session(classes):
+    # Nothing in the cached result may point back at the session the first request loaded it with
+    query = """query($term: String!) {
+        classes(term: $term) {
+            classNumber course { code attrs { value } } schedules { days instructors { name } } reserveCapacities { description }
+            enrollmentHistory { enrollmentTotal }
+        }
+    }"""
+    first = execute(query, term=term)
+    hits = result_cache.hits
+    second = execute(query, term=term)
+    assert first.errors is None and second.errors is None
+    assert result_cache.hits == hits + 1
+    assert second.data == first.data
+    assert not any(holds_instance(value) for value in result_cache.entries.values())
+
+
+def test_enrollment_buckets_hold_their_latest_stamp(classes, database_session):
+    day = datetime.datetime(2024, 3, 4)
+    for source, hour, enrollment_total in [("pdf", 9, 10), ("pdf", 15, 8), ("search", 9, -5), ("search", 15, -7)]:
+        database_session.add(ClassEnrollmentStamp(class_number=1000, term=term, enrollment_cap=20,
+                                                  enrollment_total=enrollment_total, source=source,
+                                                  timestamp=day + datetime.timedelta(hours=hour)))
+    database_session.commit()
+    query = """query($term: String!, $source: String!) {
+        enrollmentHistory(term: $term, classNumbers: [1000], source: $source) { buckets { lastSeen enrollmentTotal } }
+    }"""
+    for source, enrollment_total in [("pdf", 8), ("search", -7)]:
+        result = execute(query, term=term, source=source)
+        assert result.errors is None
+        assert result.data["enrollmentHistory"][0]["buckets"] == \
+            [{"lastSeen": "2024-03-04T15:00:00", "enrollmentTotal": enrollment_total}]
+
+    result = execute(query, term=term, source="catalog")
+    assert result.errors[0].message == "`source` must be one of pdf, search"
+
+
+def test_enrollment_history_window_keeps_the_stamp_in_force(classes, database_session):
+    # One stamp first seen on the 1st and still seen on the 10th, then new numbers on the 12th
+    database_session.add(ClassEnrollmentStamp(class_number=1000, term=term, enrollment_cap=20, enrollment_total=10,
+                                              source="pdf", timestamp=datetime.datetime(2024, 3, 1),
+                                              valid_through=datetime.datetime(2024, 3, 10)))
+    database_session.add(ClassEnrollmentStamp(class_number=1000, term=term, enrollment_cap=20, enrollment_total=12,
+                                              source="pdf", timestamp=datetime.datetime(2024, 3, 12),
+                                              valid_through=datetime.datetime(2024, 3, 12)))
+    database_session.commit()
+    query = """query($term: String!, $since: DateTime, $until: DateTime) {
+        enrollmentHistory(term: $term, classNumbers: [1000], since: $since, until: $until) {
+            buckets { start enrollmentTotal }
+        }
+    }"""
+
+    def totals(**window):
+        result = execute(query, term=term, **window)
+        assert result.errors is None
+        return [(bucket["start"], bucket["enrollmentTotal"])
+                for bucket in result.data["enrollmentHistory"][0]["buckets"]]
+
+    assert totals(since="2024-03-05T00:00:00", until="2024-03-08T00:00:00") == [("2024-03-01T00:00:00", 10)]
+    assert totals(since="2024-03-05T00:00:00") == [("2024-03-01T00:00:00", 10), ("2024-03-12T00:00:00", 12)]
+    assert totals(until="2024-03-12T00:00:00") == [("2024-03-01T00:00:00", 10)]
+    assert totals(since="2024-03-11T00:00:00") == [("2024-03-12T00:00:00", 12)]
+
+
+connection_query = """query($term: String!, $first: Int, $after: String, $days: [String!]) {
+    classesConnection(term: $term, first: $first, after: $after, days: $days) {
+        edges { cursor node { classNumber classSection course { code } } }
+        pageInfo { hasNextPage endCursor }
+    }
+}"""
+
+
+def add_sections(database_session):
+    # Sections of the same course are ordered by section and then class number, which the cursor has to seek past
+    for class_number, section, days in ((1010, "002", "MWF"), (999, "002", "TTH"), (1011, "003", "MWF")):
+        database_session.add(Class(course_id="COMP 110", class_section=section, class_number=class_number,
+                                   title="Course 0", term=term, units="3", instruction_type="In Person",
+                                   enrollment_total=0, last_updated_at=updated, last_updated_from="pdf",
+                                   schedules=[ClassSchedule(days=days, days_mask=days_to_mask(days),
+                                                            start_time=600, end_time=650)]))
+    database_session.commit()
+
+
+def pages(first: int, **variables):
+    after = None
+    while True:
+        result = execute(connection_query, term=term, first=first, after=after, **variables)
+        assert result.errors is None
+        yield result.data["classesConnection"]
+        after = result.data["classesConnection"]["pageInfo"]["endCursor"]
+        if not result.data["classesConnection"]["pageInfo"]["hasNextPage"]:
+            return
+
+
+def test_connection_pages_through_every_class_once(classes, database_session):
+    add_sections(database_session)
+    collected = [[edge["node"]["classNumber"] for edge in page["edges"]] for page in pages(2)]
+    assert collected == [[1000, 999], [1010, 1011], [1001, 1002]]
+    # Filters apply on every page, the same as in classes
+    assert [[edge["node"]["classNumber"] for edge in page["edges"]] for page in pages(2, days=["M", "W", "F"])] == \
+        [[1000, 1010], [1011, 1001], [1002]]
+
+
+def test_connection_cursors_round_trip(classes, database_session):
+    add_sections(database_session)
+    page = execute(connection_query, term=term, first=6).data["classesConnection"]
+    for edge in page["edges"]:
+        node = edge["node"]
+        assert schema_module.decode_class_cursor(edge["cursor"]) == \
+            [node["course"]["code"], node["classSection"], node["classNumber"]]
+    assert page["pageInfo"] == {"hasNextPage": False, "endCursor": page["edges"][-1]["cursor"]}
+    # Paging on from any cursor gives the rest of the classes after it
+    for index, edge in enumerate(page["edges"]):
+        rest = execute(connection_query, term=term, first=6, after=edge["cursor"]).data["classesConnection"]
+        assert rest["edges"] == page["edges"][index + 1:]
+
+
+def test_connection_first_limit(classes, monkeypatch):
+    monkeypatch.setattr(schema_module, "max_page_size", 3)
+    page = execute(connection_query, term=term, first=3).data["classesConnection"]
+    assert len(page["edges"]) == 3 and not page["pageInfo"]["hasNextPage"]
+    for first in (0, 4):
+        result = execute(connection_query, term=term, first=first)
+        assert [error.message for error in result.errors] == ["`first` must be between 1 and 3"]
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "bm90IGpzb24=", "WzEsIDJd"])
+def test_connection_rejects_invalid_cursors(classes, cursor):
+    result = execute(connection_query, term=term, first=2, after=cursor)
+    assert [error.message for error in result.errors] == [f"Invalid cursor `{cursor}`"]
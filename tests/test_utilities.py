@@ -0,0 +1,88 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import select
+
+from common.database import session_factory
+from common.models import Course, Instructor
+import utilities
+from utilities import InstructorRegistry, insert_ignoring_conflicts
+
+updated = datetime.datetime(2024, 3, 1)
+
+
+def course_row(code: str, title: str) -> dict:
+    return dict(code=code, title=title, credits="3", last_updated_at=updated, last_updated_from="search")
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_insert_ignoring_conflicts_keeps_existing_rows(database_session, monkeypatch, native):
+    if not native:
+        # Backends without an upsert syntax go through the per-row fallback
+        monkeypatch.setattr(utilities, "conflict_ignoring_inserts", {})
+    insert_ignoring_conflicts(database_session, Course, [course_row("COMP 110", "First")])
+    database_session.commit()
+    insert_ignoring_conflicts(database_session, Course, [course_row("COMP 110", "Second"),
+                                                         course_row("COMP 210", "Second")])
+    database_session.commit()
+    assert database_session.execute(select(Course.code, Course.title).order_by(Course.code)).all() == \
+        [("COMP 110", "First"), ("COMP 210", "Second")]
+
+
+def test_registry_picks_up_instructors_added_elsewhere(database_session):
+    registry = InstructorRegistry(database_session)
+    # Another term's writer, with a session and registry of its own
+    other_session = session_factory()
+    other_registry = InstructorRegistry(other_session)
+    added = other_registry.get("Smith, John", "PI")
+    other_registry.flush()
+    other_session.commit()
+
+    registry.reload()
+    assert registry.get("Smith,John", "PI").id == added.id
+    assert registry.pending == []
+    other_session.close()
+
+
+def test_registry_hands_back_one_instructor_per_name_and_type(database_session):
+    registry = InstructorRegistry(database_session)
+    smith = registry.get("Smith, John  A", "PI")
+    assert registry.get("Smith,John A", "PI") is smith
+    assert registry.get(" Smith ,John A ") is smith
+    assert registry.get("Smith,John A", "SI") is not smith
+    assert registry.get("", "PI") is registry.get(None, "PI")
+    registry.flush()
+    database_session.commit()
+    assert len(database_session.scalars(select(Instructor)).all()) == 3
+
+    # A registry for a later session starts from what's stored and creates nothing new
+    reloaded = InstructorRegistry(session_factory())
+    assert reloaded.get("Smith, John A", "PI").id == smith.id
+    assert reloaded.pending == []
+    reloaded.db_session.close()
+
+
+def test_registries_in_concurrent_sessions_add_each_instructor_once(database_session):
+    # Each thread stands in for a term's writer, which adds instructors the way PDFParser.write_chunk does: under
+    # the shared lock, after picking up whatever the others committed
+    lock = threading.Lock()
+    names = [f"Instructor,Name {number}" for number in range(20)]
+
+    def write(offset):
+        session = session_factory()
+        registry = utilities.instructor_registry(session)
+        for start in range(0, len(names), 5):
+            with lock:
+                registry.reload()
+                for name in names[(start + offset) % len(names):][:5]:
+                    registry.get(name.replace(",", ", "), "PI")
+                registry.flush()
+                session.commit()
+        session.close()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(write, [0, 5, 7, 13]))
+    stored = database_session.execute(select(Instructor.name, Instructor.instructor_type)).all()
+    assert sorted(stored) == sorted((name.replace(",", ", "), "PI") for name in names)
@@ -0,0 +1,34 @@
+import asyncio
+import datetime
+
+from common.database import async_session_factory
+from common.models import TermDataSource
+import versions
+
+
+def test_cached_data_version_is_read_once_per_ttl(database_session, monkeypatch):
+    reads = []
+    data_version = versions.data_version
+
+    async def counted_data_version(db):
+        reads.append(None)
+        return await data_version(db)
+
+    monkeypatch.setattr(versions, "data_version", counted_data_version)
+    cached = versions.CachedDataVersion(ttl=60)
+
+    async def read_concurrently():
+        return await asyncio.gather(*(cached.get(async_session_factory) for _ in range(5)))
+
+    assert asyncio.run(read_concurrently()) == [[]] * 5
+    assert len(reads) == 1
+
+    updated = datetime.datetime(2024, 3, 1)
+    database_session.add(TermDataSource(source="pdf", raw_term_name="Fall 2024", term_name="FALL_2024",
+                                        last_updated=updated, last_seen=updated))
+    database_session.commit()
+    # Within the ttl the new data isn't seen yet, once it has passed the version moves on
+    assert asyncio.run(cached.get(async_session_factory)) == []
+    cached.read_at -= 60
+    assert asyncio.run(cached.get(async_session_factory)) != []
+    assert len(reads) == 2